@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+One-off migration collapsing legacy per-unit product rows into one row per product
+
+Before products stored their quantity as a column, each product was saved as
+int(quantity) identical rows, every copy also carrying quantity=N. This script
+keeps one row out of every N duplicates created before the cutover, so that
+SUM(price * quantity) is correct for old and new rows alike.
+
+Usage:
+    python migrate_quantity_rows.py --before <timestamp> [--dry-run]
+
+Example:
+    python migrate_quantity_rows.py --before "2025-11-20 12:00" --dry-run
+    python migrate_quantity_rows.py --before "2025-11-20 12:00"
+"""
+import sys
+import logging
+import argparse
+from pathlib import Path
+from datetime import datetime
+
+# Add src to path
+sys.path.insert(0, str(Path(__file__).parent))
+
+from src.services import db_service
+
+# Configure logging
+logging.basicConfig(
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    level=logging.INFO
+)
+logger = logging.getLogger(__name__)
+
+
+# Legacy duplicates share every product column and created_at (one INSERT per receipt).
+# Within each group, every `units` consecutive rows are one product: keep the first of each run.
+# Groups whose size is not a multiple of `units` do not match the legacy pattern and are left alone.
+_LEGACY_ROWS_CTE = """
+    WITH ranked AS (
+        SELECT id,
+               FLOOR(quantity)::int AS units,
+               ROW_NUMBER() OVER ordered AS rn,
+               COUNT(*) OVER grp AS group_rows
+        FROM products
+        WHERE created_at < %s AND quantity >= 2
+        WINDOW grp AS (
+                   PARTITION BY user_id, original_product_name, translated_product_name, category,
+                                subcategory, price, receipt_date, currency, quantity, created_at
+               ),
+               ordered AS (grp ORDER BY id)
+    ),
+    duplicates AS (
+        SELECT id FROM ranked
+        WHERE group_rows %% units = 0 AND (rn - 1) %% units <> 0
+    )
+"""
+_COUNT_DUPLICATES_SQL = _LEGACY_ROWS_CTE + "SELECT COUNT(*) FROM duplicates"
+_DELETE_DUPLICATES_SQL = _LEGACY_ROWS_CTE + "DELETE FROM products WHERE id IN (SELECT id FROM duplicates)"
+
+
+def main():
+    """Main function"""
+    parser = argparse.ArgumentParser(
+        description='Collapse legacy per-unit product rows into one row per product',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  %(prog)s --before "2025-11-20 12:00" --dry-run
+  %(prog)s --before "2025-11-20 12:00"
+        """
+    )
+    
+    parser.add_argument(
+        '--before',
+        type=datetime.fromisoformat,
+        required=True,
+        help='Deployment time of the quantity-column release (database server time); '
+             'only rows created before it are treated as legacy'
+    )
+    
+    parser.add_argument(
+        '--dry-run',
+        action='store_true',
+        help='Count the duplicate rows without deleting them'
+    )
+    
+    args = parser.parse_args()
+    
+    try:
+        with db_service.get_db_cursor() as cursor:
+            if args.dry_run:
+                cursor.execute(_COUNT_DUPLICATES_SQL, (args.before,))
+                count = cursor.fetchone()[0]
+                logger.info(f"🔍 Dry run - would delete {count} legacy duplicate rows created before {args.before}")
+            else:
+                cursor.execute(_DELETE_DUPLICATES_SQL, (args.before,))
+                logger.info(f"✅ Deleted {cursor.rowcount} legacy duplicate rows created before {args.before}")
+        return 0
+    except Exception as e:
+        logger.error(f"❌ Migration failed: {e}")
+        logger.exception("Full error traceback:")
+        return 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
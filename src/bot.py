@@ -1,7 +1,11 @@
 """Main Telegram bot application"""
 import asyncio
+import csv
 import logging
+import re
+from io import StringIO
 from datetime import datetime
+from urllib.parse import urlparse
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import Application, CommandHandler, MessageHandler, CallbackQueryHandler, filters, ContextTypes, ConversationHandler
 
@@ -34,6 +38,102 @@ WAITING_FOR_PRODUCT_SUBCATEGORY = 7
 WAITING_FOR_PRODUCT_PRICE = 8
 WAITING_FOR_PRODUCT_CURRENCY = 9
 
+# Callback data patterns, compiled once and shared by the handlers in main()
+SHOW_COMMANDS_RE = re.compile(r"^show_commands$")
+LANGUAGE_RE = re.compile(r"^language_")
+CURRENCY_RE = re.compile(r"^currency_")
+EDIT_TYPE_RE = re.compile(r"^edit_(?:quantity|price|delete)$")
+PRODUCT_SEL_RE = re.compile(r"^(?:edit_product_|action_back_to_(?:list|products)$)")
+ACTION_RE = re.compile(r"^action_")
+MANUAL_CATEGORY_RE = re.compile(r"^manual_category_")
+MANUAL_SUBCATEGORY_RE = re.compile(r"^manual_subcategory_")
+MANUAL_CURRENCY_RE = re.compile(r"^manual_currency_")
+
+# Shared empty result for missing pending products (avoids allocating a new list per miss)
+_EMPTY: tuple = ()
+
+
+def _products(context: ContextTypes.DEFAULT_TYPE):
+    """Get pending receipt products from user data, or an empty tuple if there are none"""
+    return context.user_data.get('pending_receipt_products') or _EMPTY
+
+
+# Appended to save confirmations when the Google Sheets copy is written in the background
+_SHEET_PENDING_NOTE = "\nGoogle Sheets обновится в фоне."
+
+# Strong references to running background sheet writes (the event loop only keeps weak ones)
+_background_tasks: set = set()
+
+
+async def _write_sheet_async(products):
+    """Write products to Google Sheets in a worker thread, retrying transient failures with exponential backoff"""
+    for attempt in range(1, config.GS_WRITE_MAX_RETRIES + 1):
+        try:
+            written = await asyncio.to_thread(
+                gs_service.write_products_to_sheet,
+                products,
+                config.GOOGLE_SHEETS_SPREADSHEET_ID,
+                config.GOOGLE_SHEETS_TAB_NAME
+            )
+            if written:
+                logger.info(f"Successfully wrote {len(products)} products to Google Sheets")
+            else:
+                logger.warning("No products were written to Google Sheets")
+            return
+        except Exception as gs_error:
+            # Retrying a write that may have been applied would duplicate the rows
+            if not gs_service.is_transient_error(gs_error):
+                logger.error(f"Google Sheets write failed, not retrying: {gs_error}")
+                return
+            if attempt == config.GS_WRITE_MAX_RETRIES:
+                logger.error(f"Giving up writing to Google Sheets after {attempt} attempts: {gs_error}")
+                return
+            delay = config.GS_WRITE_RETRY_BASE_DELAY * 2 ** (attempt - 1)
+            logger.warning(f"Google Sheets write failed (attempt {attempt}), retrying in {delay:.0f}s: {gs_error}")
+            await asyncio.sleep(delay)
+
+
+def _schedule_sheet_write(products) -> bool:
+    """Start a background Google Sheets write if a spreadsheet is configured"""
+    if not config.GOOGLE_SHEETS_SPREADSHEET_ID:
+        return False
+    task = asyncio.create_task(_write_sheet_async(list(products)))
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    return True
+
+
+async def _drain_background_tasks(application: Application):
+    """Wait (bounded) for pending background sheet writes before the bot stops"""
+    if not _background_tasks:
+        return
+    logger.info(f"Waiting for {len(_background_tasks)} pending Google Sheets writes...")
+    _, pending = await asyncio.wait(set(_background_tasks), timeout=config.GS_WRITE_SHUTDOWN_TIMEOUT)
+    if pending:
+        logger.error(f"{len(pending)} Google Sheets writes did not finish before shutdown and were lost")
+
+
+# Columns (and their defaults) of the CSV rebuilt from edited products
+_CSV_COLUMNS = (
+    ('original_product_name', ''),
+    ('translated_product_name', ''),
+    ('category', 'Unknown'),
+    ('subcategory', 'Unknown'),
+    ('price', '0'),
+    ('receipt_date', ''),
+    ('currency', ''),
+)
+_CSV_FIELDS = tuple(field for field, _ in _CSV_COLUMNS)
+
+
+def _products_to_csv(products) -> str:
+    """Rebuild receipt CSV from the (edited) products list"""
+    output = StringIO()
+    writer = csv.writer(output)
+    writer.writerow(_CSV_FIELDS)
+    writer.writerows([p.get(field, default) for field, default in _CSV_COLUMNS] for p in products)
+    return output.getvalue()
+
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle /start command"""
@@ -314,8 +414,7 @@ async def process_photos_with_language(update: Update, context: ContextTypes.DEF
         await ask_for_currency(update, context, csv_response, products)
             
     except Exception as e:
-        logger.error(f"Error processing photos with language: {e}")
-        logger.exception("Full error traceback:")
+        logger.error("Error processing photos with language: %s", e, exc_info=logger.isEnabledFor(logging.DEBUG))
         
         # Extract more informative error message
         error_str = str(e)
@@ -349,24 +448,23 @@ async def process_media_group(media_group_id: str, update: Update, context: Cont
         waited += check_interval
         
         # Check if we have the media group and if it's still being updated
-        if media_group_id in telegram_utils.media_groups:
-            last_update = telegram_utils.media_groups[media_group_id]['last_update']
+        media_group = telegram_utils.media_groups.get(media_group_id)
+        if media_group is not None:
+            last_update = media_group['last_update']
             time_since_update = (datetime.now() - last_update).total_seconds()
             
             # If no new photos arrived for threshold time, assume all photos are collected
             if time_since_update >= idle_threshold:
                 break
     
-    # Get all collected photos
-    if media_group_id not in telegram_utils.media_groups:
+    # Take all collected photos, removing the group immediately to avoid duplicate processing
+    media_group = telegram_utils.media_groups.pop(media_group_id, None)
+    if media_group is None:
         return
     
-    photos_to_process = telegram_utils.media_groups[media_group_id]['photos'].copy()
+    photos_to_process = media_group['photos']
     num_photos = len(photos_to_process)
     
-    # Clean up immediately to avoid duplicate processing
-    del telegram_utils.media_groups[media_group_id]
-    
     if num_photos == 0:
         return
     
@@ -380,7 +478,7 @@ async def process_media_group(media_group_id: str, update: Update, context: Cont
 async def save_receipt_with_currency(update: Update, context: ContextTypes.DEFAULT_TYPE, currency: str):
     """Save receipt to Google Sheets and database with currency"""
     csv_response = context.user_data.get('pending_receipt_csv')
-    products = context.user_data.get('pending_receipt_products')
+    products = _products(context)
     
     if not csv_response or not products:
         logger.error("No pending receipt data found")
@@ -401,40 +499,28 @@ async def save_receipt_with_currency(update: Update, context: ContextTypes.DEFAU
     # Get user ID for database operations
     user_id = update.effective_user.id
     
-    # Write to Google Sheets if configured
-    gs_success = False
-    if config.GOOGLE_SHEETS_SPREADSHEET_ID:
-        try:
-            gs_service.write_products_to_sheet(
-                products,
-                config.GOOGLE_SHEETS_SPREADSHEET_ID,
-                config.GOOGLE_SHEETS_TAB_NAME
-            )
-            logger.info(f"Successfully wrote data to Google Sheets with currency {currency}")
-            gs_success = True
-        except Exception as gs_error:
-            logger.error(f"Error writing to Google Sheets: {gs_error}")
-            logger.exception("Google Sheets error traceback:")
-    
-    # Write to database
+    # Write to database (source of truth)
     db_success = False
     try:
-        db_success = db_service.save_products_to_db(user_id, products)
+        # psycopg2 is blocking; keep the event loop free for other updates
+        db_success = await asyncio.to_thread(db_service.save_products_to_db, user_id, products)
         if db_success:
             logger.info(f"Successfully saved data to database with currency {currency}")
     except Exception as db_error:
-        logger.error(f"Error writing to database: {db_error}")
-        logger.exception("Database error traceback:")
+        logger.error("Error writing to database: %s", db_error, exc_info=logger.isEnabledFor(logging.DEBUG))
+    
+    # Mirror to Google Sheets in the background once the database has the data
+    gs_scheduled = db_success and _schedule_sheet_write(products)
     
     # Send appropriate message based on results
     message_parts = []
-    if gs_success:
-        message_parts.append("Google Sheets")
     if db_success:
         message_parts.append("базу данных")
     
     if message_parts:
         success_message = f"✅ Чек сохранен в {', '.join(message_parts)}."
+        if gs_scheduled:
+            success_message += _SHEET_PENDING_NOTE
         if update.callback_query:
             await update.callback_query.message.reply_text(success_message)
         elif update.message:
@@ -538,7 +624,7 @@ async def handle_currency_callback(update: Update, context: ContextTypes.DEFAULT
         context.user_data['selected_currency'] = currency
         
         # Add currency to products
-        products = context.user_data.get('pending_receipt_products', [])
+        products = _products(context)
         for product in products:
             product['currency'] = currency
         
@@ -570,7 +656,7 @@ async def handle_custom_currency(update: Update, context: ContextTypes.DEFAULT_T
     context.user_data['selected_currency'] = currency_text
     
     # Add currency to products
-    products = context.user_data.get('pending_receipt_products', [])
+    products = _products(context)
     for product in products:
         product['currency'] = currency_text
     
@@ -590,7 +676,7 @@ async def handle_action_callback(update: Update, context: ContextTypes.DEFAULT_T
     
     if callback_data == "action_edit":
         # Show products as buttons
-        products = context.user_data.get('pending_receipt_products', [])
+        products = _products(context)
         if not products:
             await query.edit_message_text("❌ Ошибка: список товаров не найден.")
             return
@@ -617,7 +703,7 @@ async def handle_action_callback(update: Update, context: ContextTypes.DEFAULT_T
     elif callback_data == "action_confirm":
         # Save receipt with already selected currency
         currency = context.user_data.get('selected_currency')
-        products = context.user_data.get('pending_receipt_products', [])
+        products = _products(context)
         csv_response = context.user_data.get('pending_receipt_csv', '')
         
         if not products or not csv_response:
@@ -657,7 +743,7 @@ async def handle_product_selection(update: Update, context: ContextTypes.DEFAULT
     
     if callback_data == "action_back_to_list" or callback_data == "action_back_to_products":
         # Show products list with action buttons again
-        products = context.user_data.get('pending_receipt_products', [])
+        products = _products(context)
         if not products:
             await query.edit_message_text("❌ Ошибка: список товаров не найден.")
             return
@@ -683,7 +769,7 @@ async def handle_product_selection(update: Update, context: ContextTypes.DEFAULT
     
     # Extract product index
     product_idx = int(callback_data.replace("edit_product_", ""))
-    products = context.user_data.get('pending_receipt_products', [])
+    products = _products(context)
     
     if product_idx < 0 or product_idx >= len(products):
         await query.edit_message_text("❌ Ошибка: неверный индекс товара.")
@@ -724,7 +810,7 @@ async def handle_edit_type_callback(update: Update, context: ContextTypes.DEFAUL
         context.user_data.pop('waiting_for_manual_currency', None)
     
     callback_data = query.data
-    products = context.user_data.get('pending_receipt_products', [])
+    products = _products(context)
     product_idx = context.user_data.get('editing_product_idx')
     
     if product_idx is None or product_idx < 0 or product_idx >= len(products):
@@ -749,24 +835,7 @@ async def handle_edit_type_callback(update: Update, context: ContextTypes.DEFAUL
         
         # Update CSV if needed
         if products:
-            # Rebuild CSV from products
-            import csv
-            from io import StringIO
-            output = StringIO()
-            writer = csv.DictWriter(output, fieldnames=['original_product_name', 'translated_product_name', 
-                                                         'category', 'subcategory', 'price', 'receipt_date', 'currency'])
-            writer.writeheader()
-            for p in products:
-                writer.writerow({
-                    'original_product_name': p.get('original_product_name', ''),
-                    'translated_product_name': p.get('translated_product_name', ''),
-                    'category': p.get('category', 'Unknown'),
-                    'subcategory': p.get('subcategory', 'Unknown'),
-                    'price': p.get('price', '0'),
-                    'receipt_date': p.get('receipt_date', ''),
-                    'currency': p.get('currency', '')
-                })
-            context.user_data['pending_receipt_csv'] = output.getvalue()
+            context.user_data['pending_receipt_csv'] = _products_to_csv(products)
         else:
             # No products left
             context.user_data.pop('pending_receipt_csv', None)
@@ -788,7 +857,7 @@ async def handle_quantity_input(update: Update, context: ContextTypes.DEFAULT_TY
             await update.message.reply_text("❌ Количество должно быть больше нуля. Попробуйте еще раз:")
             return WAITING_FOR_QUANTITY
         
-        products = context.user_data.get('pending_receipt_products', [])
+        products = _products(context)
         product_idx = context.user_data.get('editing_product_idx')
         
         if product_idx is None or product_idx < 0 or product_idx >= len(products):
@@ -804,23 +873,7 @@ async def handle_quantity_input(update: Update, context: ContextTypes.DEFAULT_TY
         context.user_data.pop('editing_product_idx', None)
         
         # Update CSV
-        import csv
-        from io import StringIO
-        output = StringIO()
-        writer = csv.DictWriter(output, fieldnames=['original_product_name', 'translated_product_name', 
-                                                     'category', 'subcategory', 'price', 'receipt_date', 'currency'])
-        writer.writeheader()
-        for p in products:
-            writer.writerow({
-                'original_product_name': p.get('original_product_name', ''),
-                'translated_product_name': p.get('translated_product_name', ''),
-                'category': p.get('category', 'Unknown'),
-                'subcategory': p.get('subcategory', 'Unknown'),
-                'price': p.get('price', '0'),
-                'receipt_date': p.get('receipt_date', ''),
-                'currency': p.get('currency', '')
-            })
-        context.user_data['pending_receipt_csv'] = output.getvalue()
+        context.user_data['pending_receipt_csv'] = _products_to_csv(products)
         
         # Show updated list
         await show_updated_products_list_message(update.message, context, products)
@@ -842,7 +895,7 @@ async def handle_price_input(update: Update, context: ContextTypes.DEFAULT_TYPE)
             await update.message.reply_text("❌ Цена не может быть отрицательной. Попробуйте еще раз:")
             return WAITING_FOR_PRICE
         
-        products = context.user_data.get('pending_receipt_products', [])
+        products = _products(context)
         product_idx = context.user_data.get('editing_product_idx')
         
         if product_idx is None or product_idx < 0 or product_idx >= len(products):
@@ -858,23 +911,7 @@ async def handle_price_input(update: Update, context: ContextTypes.DEFAULT_TYPE)
         context.user_data.pop('editing_product_idx', None)
         
         # Update CSV
-        import csv
-        from io import StringIO
-        output = StringIO()
-        writer = csv.DictWriter(output, fieldnames=['original_product_name', 'translated_product_name', 
-                                                     'category', 'subcategory', 'price', 'receipt_date', 'currency'])
-        writer.writeheader()
-        for p in products:
-            writer.writerow({
-                'original_product_name': p.get('original_product_name', ''),
-                'translated_product_name': p.get('translated_product_name', ''),
-                'category': p.get('category', 'Unknown'),
-                'subcategory': p.get('subcategory', 'Unknown'),
-                'price': p.get('price', '0'),
-                'receipt_date': p.get('receipt_date', ''),
-                'currency': p.get('currency', '')
-            })
-        context.user_data['pending_receipt_csv'] = output.getvalue()
+        context.user_data['pending_receipt_csv'] = _products_to_csv(products)
         
         # Show updated list
         await show_updated_products_list_message(update.message, context, products)
@@ -1174,35 +1211,21 @@ async def save_manual_product(update: Update, context: ContextTypes.DEFAULT_TYPE
     # Get user ID for database operations
     user_id = update.effective_user.id
     
-    # Write to Google Sheets if configured
-    gs_success = False
-    if config.GOOGLE_SHEETS_SPREADSHEET_ID:
-        try:
-            gs_service.write_products_to_sheet(
-                products,
-                config.GOOGLE_SHEETS_SPREADSHEET_ID,
-                config.GOOGLE_SHEETS_TAB_NAME
-            )
-            logger.info(f"Successfully wrote manual product to Google Sheets")
-            gs_success = True
-        except Exception as gs_error:
-            logger.error(f"Error writing to Google Sheets: {gs_error}")
-            logger.exception("Google Sheets error traceback:")
-    
-    # Write to database
+    # Write to database (source of truth)
     db_success = False
     try:
-        db_success = db_service.save_products_to_db(user_id, products)
+        # psycopg2 is blocking; keep the event loop free for other updates
+        db_success = await asyncio.to_thread(db_service.save_products_to_db, user_id, products)
         if db_success:
             logger.info(f"Successfully saved manual product to database")
     except Exception as db_error:
-        logger.error(f"Error writing to database: {db_error}")
-        logger.exception("Database error traceback:")
+        logger.error("Error writing to database: %s", db_error, exc_info=logger.isEnabledFor(logging.DEBUG))
+    
+    # Mirror to Google Sheets in the background once the database has the data
+    gs_scheduled = db_success and _schedule_sheet_write(products)
     
     # Send appropriate message based on results
     message_parts = []
-    if gs_success:
-        message_parts.append("Google Sheets")
     if db_success:
         message_parts.append("базу данных")
     
@@ -1216,6 +1239,8 @@ async def save_manual_product(update: Update, context: ContextTypes.DEFAULT_TYPE
             f"💰 Цена: {price} {currency}\n"
             f"📅 Дата: {product.get('receipt_date', '')}"
         )
+        if gs_scheduled:
+            success_message += _SHEET_PENDING_NOTE
     else:
         success_message = "❌ Ошибка при сохранении товара."
     
@@ -1240,7 +1265,9 @@ async def handle_photo(update: Update, context: ContextTypes.DEFAULT_TYPE):
         # Add to media group collection
         current_time = datetime.now()
         
-        if media_group_id not in telegram_utils.media_groups:
+        media_group = telegram_utils.media_groups.get(media_group_id)
+        
+        if media_group is None:
             # First photo in the group - start collection and schedule processing
             telegram_utils.media_groups[media_group_id] = {
                 'photos': [photo_bytes],
@@ -1257,9 +1284,9 @@ async def handle_photo(update: Update, context: ContextTypes.DEFAULT_TYPE):
             asyncio.create_task(process_media_group(media_group_id, update, context))
         else:
             # Additional photo in existing group
-            telegram_utils.media_groups[media_group_id]['photos'].append(photo_bytes)
-            telegram_utils.media_groups[media_group_id]['last_update'] = current_time
-            num_collected = len(telegram_utils.media_groups[media_group_id]['photos'])
+            media_group['photos'].append(photo_bytes)
+            media_group['last_update'] = current_time
+            num_collected = len(media_group['photos'])
             logger.info(f"Added photo to media group {media_group_id}, total: {num_collected}")
             await update.message.reply_text(f"📸 Получено фото {num_collected}...")
     else:
@@ -1279,13 +1306,30 @@ def main():
         logger.error("Please create a .env file with TELEGRAM_BOT_TOKEN and OPENAI_API_KEY")
         raise ValueError("OPENAI_API_KEY not found in environment variables. Create a .env file.")
     
+    # Use uvloop for the event loop when it is available
+    try:
+        import uvloop
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    except ImportError:
+        logger.info("uvloop not installed, using the default asyncio event loop")
+    
     # Create application
     try:
-        application = Application.builder().token(config.TELEGRAM_BOT_TOKEN).build()
+        application = (
+            Application.builder()
+            .token(config.TELEGRAM_BOT_TOKEN)
+            .request(telegram_utils.build_request(
+                connection_pool_size=config.TELEGRAM_CONNECTION_POOL_SIZE,
+                pool_timeout=config.TELEGRAM_POOL_TIMEOUT
+            ))
+            .get_updates_request(telegram_utils.build_request())
+            .post_stop(_drain_background_tasks)
+            .build()
+        )
         
         # Create conversation handler for language selection
         language_conv_handler = ConversationHandler(
-            entry_points=[CallbackQueryHandler(handle_language_callback, pattern="^language_")],
+            entry_points=[CallbackQueryHandler(handle_language_callback, pattern=LANGUAGE_RE)],
             states={
                 WAITING_FOR_LANGUAGE: [MessageHandler(filters.TEXT & ~filters.COMMAND, handle_custom_language)],
             },
@@ -1294,7 +1338,7 @@ def main():
         
         # Create conversation handler for currency selection
         currency_conv_handler = ConversationHandler(
-            entry_points=[CallbackQueryHandler(handle_currency_callback, pattern="^currency_")],
+            entry_points=[CallbackQueryHandler(handle_currency_callback, pattern=CURRENCY_RE)],
             states={
                 WAITING_FOR_CURRENCY: [MessageHandler(filters.TEXT & ~filters.COMMAND, handle_custom_currency)],
             },
@@ -1304,7 +1348,7 @@ def main():
         # Create conversation handler for editing products
         edit_conv_handler = ConversationHandler(
             entry_points=[
-                CallbackQueryHandler(handle_edit_type_callback, pattern="^edit_(quantity|price|delete)$")
+                CallbackQueryHandler(handle_edit_type_callback, pattern=EDIT_TYPE_RE)
             ],
             states={
                 WAITING_FOR_QUANTITY: [MessageHandler(filters.TEXT & ~filters.COMMAND, handle_quantity_input)],
@@ -1318,11 +1362,11 @@ def main():
             entry_points=[CommandHandler("add_product", add_product_command)],
             states={
                 WAITING_FOR_PRODUCT_NAME: [MessageHandler(filters.TEXT & ~filters.COMMAND, handle_product_name_input)],
-                WAITING_FOR_PRODUCT_CATEGORY: [CallbackQueryHandler(handle_manual_category_callback, pattern="^manual_category_")],
-                WAITING_FOR_PRODUCT_SUBCATEGORY: [CallbackQueryHandler(handle_manual_subcategory_callback, pattern="^manual_subcategory_")],
+                WAITING_FOR_PRODUCT_CATEGORY: [CallbackQueryHandler(handle_manual_category_callback, pattern=MANUAL_CATEGORY_RE)],
+                WAITING_FOR_PRODUCT_SUBCATEGORY: [CallbackQueryHandler(handle_manual_subcategory_callback, pattern=MANUAL_SUBCATEGORY_RE)],
                 WAITING_FOR_PRODUCT_PRICE: [MessageHandler(filters.TEXT & ~filters.COMMAND, handle_product_price_input)],
                 WAITING_FOR_PRODUCT_CURRENCY: [
-                    CallbackQueryHandler(handle_manual_currency_callback, pattern="^manual_currency_"),
+                    CallbackQueryHandler(handle_manual_currency_callback, pattern=MANUAL_CURRENCY_RE),
                     MessageHandler(filters.TEXT & ~filters.COMMAND, handle_manual_currency_input)
                 ],
             },
@@ -1332,18 +1376,32 @@ def main():
         # Add handlers (order matters - more specific patterns first)
         application.add_handler(CommandHandler("start", start))
         application.add_handler(CommandHandler("help", help_command))
-        application.add_handler(CallbackQueryHandler(show_commands, pattern="^show_commands$"))
+        application.add_handler(CallbackQueryHandler(show_commands, pattern=SHOW_COMMANDS_RE))
         application.add_handler(manual_product_conv_handler)
         application.add_handler(MessageHandler(filters.PHOTO, handle_photo))
-        application.add_handler(CallbackQueryHandler(handle_product_selection, pattern="^edit_product_|^action_back_to_list$|^action_back_to_products$"))
-        application.add_handler(CallbackQueryHandler(handle_action_callback, pattern="^action_"))
+        application.add_handler(CallbackQueryHandler(handle_product_selection, pattern=PRODUCT_SEL_RE))
+        application.add_handler(CallbackQueryHandler(handle_action_callback, pattern=ACTION_RE))
         application.add_handler(edit_conv_handler)
         application.add_handler(currency_conv_handler)
         application.add_handler(language_conv_handler)
         
+        # Only request the update types the handlers above consume
+        allowed_updates = [Update.MESSAGE, Update.CALLBACK_QUERY]
+        
         # Start bot
-        logger.info("Bot started successfully")
-        application.run_polling(allowed_updates=Update.ALL_TYPES)
+        if config.WEBHOOK_URL:
+            logger.info(f"Bot started successfully (webhook on port {config.WEBHOOK_PORT})")
+            application.run_webhook(
+                listen=config.WEBHOOK_LISTEN,
+                port=config.WEBHOOK_PORT,
+                url_path=urlparse(config.WEBHOOK_URL).path.lstrip('/'),
+                webhook_url=config.WEBHOOK_URL,
+                secret_token=config.WEBHOOK_SECRET,
+                allowed_updates=allowed_updates
+            )
+        else:
+            logger.info("Bot started successfully (polling)")
+            application.run_polling(allowed_updates=allowed_updates)
     except Exception as e:
         logger.error(f"Failed to start bot: {e}")
         raise
@@ -3,8 +3,22 @@ import os
 from pathlib import Path
 from dotenv import load_dotenv
 
-# Load environment variables
-load_dotenv()
+# Settings every deployment provides (docker-compose.yml always sets all of them).
+# .env is skipped only when each of these is already in the environment, so list
+# mandatory settings only: an optional key (e.g. WEBHOOK_*) here would force load_dotenv()
+# on every start, and a mandatory key missing here would never be read from .env.
+_REQUIRED_ENV_VARS = (
+    # API Keys
+    'TELEGRAM_BOT_TOKEN', 'OPENAI_API_KEY',
+    # Google Sheets Settings
+    'GOOGLE_SHEETS_SPREADSHEET_ID', 'GOOGLE_SHEETS_TAB_NAME',
+    # Database Settings
+    'DB_HOST', 'DB_PORT', 'DB_NAME', 'DB_USER', 'DB_PASSWORD',
+)
+
+# Load environment variables from .env unless the environment already provides the required ones
+if not all(name in os.environ for name in _REQUIRED_ENV_VARS):
+    load_dotenv()
 
 # Get the project root directory (parent of src/)
 PROJECT_ROOT = Path(__file__).parent.parent
@@ -24,18 +38,43 @@ OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
 # OpenAI Settings
 OPENAI_MODEL = "gpt-4o"
 OPENAI_MAX_TOKENS = 4000
+# Vision detail level for receipt images ("low" is ~512px and too coarse to read receipt text)
+OPENAI_IMAGE_DETAIL = "high"
+# Receipt photos sent together in a single vision request
+OPENAI_MAX_IMAGES_PER_REQUEST = 8
+# Upper bound on in-flight OpenAI requests (retry prompts run concurrently)
+OPENAI_MAX_CONCURRENT_REQUESTS = 4
+
+# Receipt image preprocessing (vision tokens scale with image size)
+MAX_RECEIPT_IMAGE_EDGE = 1536  # pixels, long edge
+RECEIPT_JPEG_QUALITY = 85
 
 # Media Group Settings
 MEDIA_GROUP_MAX_WAIT_TIME = 3.0  # seconds
 MEDIA_GROUP_CHECK_INTERVAL = 0.5  # seconds
 MEDIA_GROUP_IDLE_THRESHOLD = 1.0  # seconds
+MEDIA_GROUP_CACHE_MAXSIZE = 1024  # media groups being collected at once
+MEDIA_GROUP_CACHE_TTL = 60.0  # seconds before an unprocessed media group is evicted
 
 # Telegram Message Settings
 MAX_MESSAGE_LENGTH = 4000  # Telegram message limit
+# Connection pool for Bot API calls (replies, edits, downloads); getUpdates keeps its own single connection
+TELEGRAM_CONNECTION_POOL_SIZE = 256
+TELEGRAM_POOL_TIMEOUT = 10.0  # seconds to wait for a free pooled connection
+
+# Telegram Webhook Settings (the bot falls back to long polling when WEBHOOK_URL is not set)
+WEBHOOK_URL = os.getenv('WEBHOOK_URL') or None
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET') or None
+WEBHOOK_LISTEN = "0.0.0.0"
+WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT') or 8443)
 
 # Google Sheets Settings
 GOOGLE_SHEETS_SPREADSHEET_ID = os.getenv('GOOGLE_SHEETS_SPREADSHEET_ID')
 GOOGLE_SHEETS_TAB_NAME = os.getenv('GOOGLE_SHEETS_TAB_NAME', 'november_2025')
+# Background sheet writes are retried with exponential backoff (1s, 2s, 4s, ...)
+GS_WRITE_MAX_RETRIES = 4
+GS_WRITE_RETRY_BASE_DELAY = 1.0  # seconds
+GS_WRITE_SHUTDOWN_TIMEOUT = 15.0  # seconds to let pending sheet writes finish when the bot stops
 
 # Database Settings
 DB_HOST = os.getenv('DB_HOST', 'localhost')
@@ -43,4 +82,7 @@ DB_PORT = os.getenv('DB_PORT', '5432')
 DB_NAME = os.getenv('DB_NAME', 'receipty_bot')
 DB_USER = os.getenv('DB_USER', 'postgres')
 DB_PASSWORD = os.getenv('DB_PASSWORD', '')
+DB_POOL_MIN_CONN = 1
+DB_POOL_MAX_CONN = 10
+DB_COPY_CHUNK_SIZE = 10000  # products per COPY batch in bulk imports
 
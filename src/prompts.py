@@ -1,27 +1,19 @@
 """Prompt templates and category loading"""
 import logging
 import csv
-from pathlib import Path
-from typing import Dict, List
+from functools import lru_cache
+from types import MappingProxyType
+from typing import List, Mapping
 from . import config
 
 logger = logging.getLogger(__name__)
 
 
-def load_categories() -> str:
-    """Load categories from CSV file and return as string for prompt"""
-    try:
-        with open(config.RECEIPT_CATEGORIES_PATH, 'r', encoding='utf-8') as f:
-            return f.read()
-    except Exception as e:
-        logger.error(f"Error loading categories: {e}")
-        return ""
-
-
-def load_categories_dict() -> Dict[str, List[str]]:
+@lru_cache(maxsize=1)
+def load_categories_dict() -> Mapping[str, List[str]]:
     """
-    Load categories from CSV file and return as dictionary
-    Returns: Dict with category_group as key and list of subcategories as value
+    Load categories from CSV file and return as dictionary (read once per process)
+    Returns: Read-only mapping with category_group as key and list of subcategories as value
     """
     categories_dict = {}
     try:
@@ -35,31 +27,26 @@ def load_categories_dict() -> Dict[str, List[str]]:
                         categories_dict[category] = []
                     if subcategory not in categories_dict[category]:
                         categories_dict[category].append(subcategory)
-        return categories_dict
+        return MappingProxyType(categories_dict)
     except Exception as e:
         logger.error(f"Error loading categories dictionary: {e}")
-        return {}
+        return MappingProxyType({})
 
 
 def get_category_list() -> List[str]:
     """Get list of all unique categories"""
-    categories_dict = load_categories_dict()
-    return sorted(categories_dict.keys())
+    return sorted(load_categories_dict().keys())
 
 
 def get_subcategories_for_category(category: str) -> List[str]:
     """Get list of subcategories for a given category"""
-    categories_dict = load_categories_dict()
-    return sorted(categories_dict.get(category, []))
+    return sorted(load_categories_dict().get(category, []))
 
 
-def get_prompt(language: str = "serbian") -> str:
-    """Get the prompt for OpenAI API"""
-    categories_csv = load_categories()
-
-    prompt = f"""You are analyzing one or more supermarket receipts (non-personal, sample data only).
+# Prompt bodies; each has a single {language} placeholder
+_PROMPT_BODY = """You are analyzing one or more supermarket receipts (non-personal, sample data only).
     
-    Receipts will be on {language.lower()} language.
+    Receipts will be on {language} language.
 
     TASK:
     1. Read the attached receipt images using your vision capabilities.
@@ -70,7 +57,7 @@ def get_prompt(language: str = "serbian") -> str:
            • total price for that product
        - The purchase date shown on the receipt (e.g., "2025-11-04").
     3. Validate internally that the total sum of all products matches the receipt total (do not include this validation in output).
-    4. Categorize each product into a main category and subcategory using the provided 'receipt_categories.csv' reference.
+    4. Categorize each product into a main category and subcategory using the provided categories reference (one "Category: subcategory; subcategory; ..." line per category).
     5. Translate each product name into Russian.
 
     OUTPUT FORMAT (MANDATORY):
@@ -97,18 +84,9 @@ def get_prompt(language: str = "serbian") -> str:
     Categories reference (for classification assistance):
     """
 
-    prompt += categories_csv
-    
-    return prompt
-
+_PROMPT_RETRY_1_BODY = """You are analyzing a supermarket receipts image.
 
-def get_prompt_retry_1(language: str = "serbian") -> str:
-    """Get the first retry prompt for OpenAI API"""
-    categories_csv = load_categories()
-    
-    prompt = f"""You are analyzing a supermarket receipts image.
-
-Receipts will be on {language.lower()} language 
+Receipts will be on {language} language 
 
 STRICT TASK:
 
@@ -144,6 +122,8 @@ Rules:
 
 - One line per product.
 
+- Repeat the same receipt_date for all products from the same receipt.
+
 - ALL text fields in double quotes.
 
 - Decimal separator is '.'.
@@ -160,17 +140,9 @@ Rules:
 
 Categories reference (for classification assistance):
 """
-    prompt += categories_csv
-    
-    return prompt
-
 
-def get_prompt_retry_2(language: str = "serbian") -> str:
-    """Get the second retry prompt for OpenAI API"""
-    categories_csv = load_categories()
-    
-    prompt = f"""You are analyzing a receipt image.
-    Receipts will be on {language.lower()} language.
+_PROMPT_RETRY_2_BODY = """You are analyzing a receipt image.
+    Receipts will be on {language} language.
 
 TASK:
 
@@ -204,6 +176,8 @@ Rules:
 
 - One product per row.
 
+- Repeat the same receipt_date for all products from the same receipt.
+
 - All text fields in double quotes.
 
 - Decimal separator is '.'.
@@ -216,7 +190,41 @@ Rules:
 
 Categories reference:
 """
-    prompt += categories_csv
-    
-    return prompt
 
+
+def _compact_categories() -> str:
+    """Render categories as one 'Category: sub1; sub2' line per category (far fewer tokens than the raw CSV)"""
+    return "\n".join(
+        f"{category}: {'; '.join(subcategories)}"
+        for category, subcategories in load_categories_dict().items()
+    )
+
+
+def _build_template(body: str) -> str:
+    """Bind the categories reference into a prompt body, leaving only {language} to fill"""
+    categories = _compact_categories().replace('{', '{{').replace('}', '}}')
+    return body + categories
+
+
+# Prompt templates are built once at import, so a prompt is a single str.format call
+_PROMPT_TMPL = _build_template(_PROMPT_BODY)
+_PROMPT_RETRY_1_TMPL = _build_template(_PROMPT_RETRY_1_BODY)
+_PROMPT_RETRY_2_TMPL = _build_template(_PROMPT_RETRY_2_BODY)
+
+
+@lru_cache(maxsize=8)
+def get_prompt(language: str = "serbian") -> str:
+    """Get the prompt for OpenAI API"""
+    return _PROMPT_TMPL.format(language=language.lower())
+
+
+@lru_cache(maxsize=8)
+def get_prompt_retry_1(language: str = "serbian") -> str:
+    """Get the first retry prompt for OpenAI API"""
+    return _PROMPT_RETRY_1_TMPL.format(language=language.lower())
+
+
+@lru_cache(maxsize=8)
+def get_prompt_retry_2(language: str = "serbian") -> str:
+    """Get the second retry prompt for OpenAI API"""
+    return _PROMPT_RETRY_2_TMPL.format(language=language.lower())
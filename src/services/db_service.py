@@ -1,60 +1,133 @@
 """PostgreSQL database service for storing receipt data"""
+import csv
 import logging
+import threading
+from io import StringIO
+from decimal import Decimal
 import psycopg2
 from psycopg2.extras import RealDictCursor
+from psycopg2.pool import ThreadedConnectionPool
 from psycopg2 import sql
 from typing import List, Dict, Optional
 from contextlib import contextmanager
 from .. import config
+from ..utils.number_utils import to_decimal, to_quantity
 
 logger = logging.getLogger(__name__)
 
+_ZERO = Decimal('0')
 
-def get_db_connection():
+# Products are written with COPY; \N marks NULL so empty strings stay empty strings
+_COPY_NULL = '\\N'
+_COPY_PRODUCTS_SQL = (
+    "COPY products (user_id, original_product_name, translated_product_name, category, "
+    "subcategory, price, receipt_date, currency, quantity) "
+    "FROM STDIN WITH (FORMAT csv, NULL '\\N')"
+)
+
+# Server-side prepared user upsert, created once per pooled connection
+_PREPARE_UPSERT_USER = """
+    PREPARE upsert_user (bigint) AS
+    INSERT INTO "user" (telegram_id) VALUES ($1)
+    ON CONFLICT (telegram_id) DO UPDATE SET updated_at = CURRENT_TIMESTAMP
+    RETURNING id
+"""
+
+
+class _PooledConnection(psycopg2.extensions.connection):
+    """Connection that remembers whether its prepared statements exist"""
+    statements_prepared = False
+
+
+# Connection pool, created on first use so importing this module does not need a database
+_pool: Optional[ThreadedConnectionPool] = None
+_pool_lock = threading.Lock()
+# getconn() raises PoolError instead of blocking when the pool is exhausted,
+# so checkouts are gated to make extra callers wait for a free connection
+_pool_slots = threading.BoundedSemaphore(config.DB_POOL_MAX_CONN)
+
+
+def get_db_pool() -> ThreadedConnectionPool:
     """
-    Create and return a database connection
+    Create (once) and return the database connection pool
     
     Returns:
-        psycopg2.connection: Database connection object
+        psycopg2.pool.ThreadedConnectionPool: Connection pool
     """
+    global _pool
+    if _pool is not None:
+        return _pool
+    
+    with _pool_lock:
+        if _pool is None:
+            try:
+                _pool = ThreadedConnectionPool(
+                    minconn=config.DB_POOL_MIN_CONN,
+                    maxconn=config.DB_POOL_MAX_CONN,
+                    host=config.DB_HOST,
+                    port=config.DB_PORT,
+                    database=config.DB_NAME,
+                    user=config.DB_USER,
+                    password=config.DB_PASSWORD,
+                    connection_factory=_PooledConnection
+                )
+                logger.info("Database connection pool initialized")
+            except Exception as e:
+                logger.error(f"Failed to connect to database: {e}")
+                raise
+    return _pool
+
+
+def _prepare_statements(conn: _PooledConnection):
+    """PREPARE the hot statements on a new connection so the server parses and plans them once"""
     try:
-        conn = psycopg2.connect(
-            host=config.DB_HOST,
-            port=config.DB_PORT,
-            database=config.DB_NAME,
-            user=config.DB_USER,
-            password=config.DB_PASSWORD
-        )
-        return conn
-    except Exception as e:
-        logger.error(f"Failed to connect to database: {e}")
-        raise
+        with conn.cursor() as cursor:
+            cursor.execute(_PREPARE_UPSERT_USER)
+        # Commit so the statement exists independently of the caller's transaction
+        conn.commit()
+        conn.statements_prepared = True
+    except psycopg2.Error as e:
+        # Tables may not exist yet (e.g. during init_database); retry on the next checkout
+        conn.rollback()
+        logger.debug(f"Could not prepare statements yet: {e}")
 
 
 @contextmanager
-def get_db_cursor():
+def get_db_cursor(dict_rows: bool = False):
     """
-    Context manager for database cursor
+    Context manager for database cursor on a pooled connection
+    
+    Args:
+        dict_rows: Return rows as dicts (RealDictCursor) instead of tuples
     
     Yields:
         psycopg2.extensions.cursor: Database cursor
     """
+    pool = get_db_pool()
     conn = None
+    cursor = None
+    _pool_slots.acquire()
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor(cursor_factory=RealDictCursor)
+        conn = pool.getconn()
+        if not conn.statements_prepared:
+            _prepare_statements(conn)
+        cursor = conn.cursor(cursor_factory=RealDictCursor) if dict_rows else conn.cursor()
         yield cursor
         conn.commit()
     except Exception as e:
-        if conn:
+        if conn and not conn.closed:
             conn.rollback()
         logger.error(f"Database error: {e}")
         raise
     finally:
-        if cursor:
-            cursor.close()
-        if conn:
-            conn.close()
+        try:
+            if cursor:
+                cursor.close()
+            if conn:
+                # Return the connection to the pool, discarding it if it was broken
+                pool.putconn(conn, close=bool(conn.closed))
+        finally:
+            _pool_slots.release()
 
 
 def init_database():
@@ -110,6 +183,25 @@ def init_database():
         raise
 
 
+def _get_or_create_user_id(cursor, telegram_id: int) -> int:
+    """Get or create user by telegram_id using an existing cursor, return user ID"""
+    # Single round-trip upsert; also avoids the SELECT-then-INSERT race
+    if cursor.connection.statements_prepared:
+        cursor.execute("EXECUTE upsert_user (%s)", (telegram_id,))
+    else:
+        cursor.execute(
+            """
+            INSERT INTO "user" (telegram_id) VALUES (%s)
+            ON CONFLICT (telegram_id) DO UPDATE SET updated_at = CURRENT_TIMESTAMP
+            RETURNING id
+            """,
+            (telegram_id,)
+        )
+    user_id = cursor.fetchone()[0]
+    logger.info(f"Resolved user with telegram_id {telegram_id}, user_id: {user_id}")
+    return user_id
+
+
 def get_or_create_user(telegram_id: int) -> int:
     """
     Get user ID by telegram_id, create user if doesn't exist
@@ -122,32 +214,53 @@ def get_or_create_user(telegram_id: int) -> int:
     """
     try:
         with get_db_cursor() as cursor:
-            # Try to get existing user
-            cursor.execute(
-                'SELECT id FROM "user" WHERE telegram_id = %s',
-                (telegram_id,)
-            )
-            result = cursor.fetchone()
-            
-            if result:
-                user_id = result['id']
-                logger.info(f"Found existing user with telegram_id {telegram_id}, user_id: {user_id}")
-                return user_id
-            else:
-                # Create new user
-                cursor.execute(
-                    'INSERT INTO "user" (telegram_id) VALUES (%s) RETURNING id',
-                    (telegram_id,)
-                )
-                user_id = cursor.fetchone()['id']
-                logger.info(f"Created new user with telegram_id {telegram_id}, user_id: {user_id}")
-                return user_id
+            return _get_or_create_user_id(cursor, telegram_id)
     except Exception as e:
         logger.error(f"Error getting/creating user: {e}")
         logger.exception("Full error traceback:")
         raise
 
 
+def _copy_products(cursor, rows: List[tuple]) -> None:
+    """
+    Bulk-load product rows into the products table using COPY FROM STDIN
+    
+    Args:
+        cursor: Database cursor
+        rows: Tuples in _COPY_PRODUCTS_SQL column order; None is written as NULL
+    """
+    buffer = StringIO()
+    writer = csv.writer(buffer)
+    writer.writerows(
+        tuple(_COPY_NULL if value is None else value for value in row)
+        for row in rows
+    )
+    buffer.seek(0)
+    cursor.copy_expert(_COPY_PRODUCTS_SQL, buffer)
+
+
+def _product_row(user_id: int, product: Dict[str, str]) -> tuple:
+    """Build a products row in _COPY_PRODUCTS_SQL column order (quantity stored as a column)"""
+    quantity = to_quantity(product.get('quantity', '1'))
+    
+    # Handle receipt_date - convert empty strings to None
+    receipt_date = product.get('receipt_date')
+    if receipt_date == '' or receipt_date == 'None':
+        receipt_date = None
+    
+    return (
+        user_id,
+        product.get('original_product_name', ''),
+        product.get('translated_product_name', ''),
+        product.get('category', 'Unknown'),
+        product.get('subcategory', 'Unknown'),
+        to_decimal(product.get('price', '0'), _ZERO),
+        receipt_date,
+        product.get('currency', ''),
+        quantity
+    )
+
+
 def save_products_to_db(telegram_id: int, products: List[Dict[str, str]]) -> bool:
     """
     Save products to database
@@ -161,54 +274,17 @@ def save_products_to_db(telegram_id: int, products: List[Dict[str, str]]) -> boo
         bool: True if successful, False otherwise
     """
     try:
-        # Get or create user
-        user_id = get_or_create_user(telegram_id)
-        
+        # Resolve the user and insert products in one transaction on one pooled connection
         with get_db_cursor() as cursor:
-            # Prepare products for insertion
-            # Duplicate products based on quantity (same as Google Sheets behavior)
-            rows_to_insert = []
-            for product in products:
-                quantity_str = product.get('quantity', '1')
-                try:
-                    quantity = float(quantity_str)
-                    if quantity < 1:
-                        quantity = 1
-                except (ValueError, TypeError):
-                    quantity = 1
-                
-                # Create one row per quantity unit
-                for _ in range(int(quantity)):
-                    # Handle receipt_date - convert empty strings to None
-                    receipt_date = product.get('receipt_date')
-                    if receipt_date == '' or receipt_date == 'None':
-                        receipt_date = None
-                    
-                    rows_to_insert.append({
-                        'user_id': user_id,
-                        'original_product_name': product.get('original_product_name', ''),
-                        'translated_product_name': product.get('translated_product_name', ''),
-                        'category': product.get('category', 'Unknown'),
-                        'subcategory': product.get('subcategory', 'Unknown'),
-                        'price': product.get('price', '0'),
-                        'receipt_date': receipt_date,
-                        'currency': product.get('currency', ''),
-                        'quantity': quantity
-                    })
+            user_id = _get_or_create_user_id(cursor, telegram_id)
             
-            # Insert products
+            # Prepare products for insertion (one row per product)
+            rows_to_insert = [_product_row(user_id, product) for product in products]
+            
+            # Stream all products in with COPY (no per-statement parsing or planning)
             if rows_to_insert:
-                insert_query = """
-                    INSERT INTO products 
-                    (user_id, original_product_name, translated_product_name, category, 
-                     subcategory, price, receipt_date, currency, quantity)
-                    VALUES 
-                    (%(user_id)s, %(original_product_name)s, %(translated_product_name)s, 
-                     %(category)s, %(subcategory)s, %(price)s, %(receipt_date)s, 
-                     %(currency)s, %(quantity)s)
-                """
-                cursor.executemany(insert_query, rows_to_insert)
-                logger.info(f"Successfully saved {len(rows_to_insert)} product rows to database (from {len(products)} products with quantities)")
+                _copy_products(cursor, rows_to_insert)
+                logger.info(f"Successfully saved {len(rows_to_insert)} products to database")
                 return True
             else:
                 logger.warning("No products to save to database")
@@ -219,3 +295,40 @@ def save_products_to_db(telegram_id: int, products: List[Dict[str, str]]) -> boo
         logger.exception("Full error traceback:")
         return False
 
+
+def save_products_to_db_bulk(telegram_id: int, products: List[Dict[str, str]],
+                             chunk_size: int = config.DB_COPY_CHUNK_SIZE) -> bool:
+    """
+    Save a large number of products to database, for bulk imports
+    
+    Products are loaded with one COPY per chunk, so only one chunk's CSV buffer
+    is held in memory at a time; all chunks are committed in a single transaction.
+    
+    Args:
+        telegram_id: Telegram user ID
+        products: List of product dictionaries (same keys as save_products_to_db)
+        chunk_size: Number of products per COPY batch
+        
+    Returns:
+        bool: True if successful, False otherwise
+    """
+    if not products:
+        logger.warning("No products to save to database")
+        return False
+    
+    try:
+        with get_db_cursor() as cursor:
+            user_id = _get_or_create_user_id(cursor, telegram_id)
+            
+            for start in range(0, len(products), chunk_size):
+                chunk = products[start:start + chunk_size]
+                _copy_products(cursor, [_product_row(user_id, product) for product in chunk])
+                logger.info(f"Copied products {start + 1}-{start + len(chunk)} of {len(products)}")
+            
+            logger.info(f"Successfully saved {len(products)} products to database")
+            return True
+            
+    except Exception as e:
+        logger.error(f"Error saving products to database: {e}")
+        logger.exception("Full error traceback:")
+        return False
@@ -1,8 +1,12 @@
 """Google Sheets service for writing receipt data"""
 import logging
+import threading
 import gspread
+import requests
+from gspread.utils import absolute_range_name
+from urllib3.exceptions import NewConnectionError
 from google.oauth2.service_account import Credentials
-from typing import List, Dict
+from typing import List, Dict, Optional, Set, Tuple
 from .. import config
 from ..utils import csv_parser
 
@@ -14,35 +18,62 @@ SCOPES = [
     'https://www.googleapis.com/auth/drive'
 ]
 
+# Header row written to receipt sheets
+SHEET_HEADERS = ['original_product_name', 'translated_product_name', 'category', 'subcategory', 'price', 'receipt_date', 'currency', 'quantity']
+_HEADER_RANGE = 'A1:H1'
+# Product field and default value for each sheet column, in SHEET_HEADERS order
+_ROW_COLUMNS = tuple((header, '1' if header == 'quantity' else '') for header in SHEET_HEADERS)
+# Query parameters for spreadsheets.values.append: store values as-is and insert new rows after the data
+_APPEND_PARAMS = {'valueInputOption': 'RAW', 'insertDataOption': 'INSERT_ROWS'}
 
-def get_gs_client():
-    """Initialize and return Google Sheets client"""
-    try:
-        creds = Credentials.from_service_account_file(
-            str(config.GS_CREDS_PATH),
-            scopes=SCOPES
-        )
-        client = gspread.authorize(creds)
-        logger.info("Google Sheets client initialized successfully")
-        return client
-    except Exception as e:
-        logger.error(f"Failed to initialize Google Sheets client: {e}")
-        raise
+# Process-wide caches so each receipt does not re-authorize and re-open the sheet
+_client: Optional[gspread.Client] = None
+_spreadsheet_cache: Dict[str, gspread.Spreadsheet] = {}
+_ws_cache: Dict[Tuple[str, str], gspread.Worksheet] = {}
+# Worksheets whose header row has already been verified
+_headers_checked: Set[Tuple[str, str]] = set()
+# Guards cache population; sheet writes run in worker threads (reentrant: _get_worksheet calls get_gs_client)
+_cache_lock = threading.RLock()
 
 
-def write_products_to_sheet(products: List[Dict[str, str]], spreadsheet_id: str, tab_name: str):
-    """
-    Write products to Google Sheet
+def get_gs_client() -> gspread.Client:
+    """Initialize (once) and return Google Sheets client; google-auth refreshes its token as needed"""
+    global _client
+    if _client is not None:
+        return _client
     
-    Args:
-        products: List of product dictionaries with keys: original_product_name, 
-                 translated_product_name, category, subcategory, price, receipt_date
-        spreadsheet_id: Google Sheets spreadsheet ID
-        tab_name: Name of the tab/sheet to write to
-    """
-    try:
-        client = get_gs_client()
-        spreadsheet = client.open_by_key(spreadsheet_id)
+    with _cache_lock:
+        if _client is not None:
+            return _client
+        try:
+            creds = Credentials.from_service_account_file(
+                str(config.GS_CREDS_PATH),
+                scopes=SCOPES
+            )
+            _client = gspread.authorize(creds)
+            logger.info("Google Sheets client initialized successfully")
+            return _client
+        except Exception as e:
+            logger.error(f"Failed to initialize Google Sheets client: {e}")
+            raise
+
+
+def _get_worksheet(spreadsheet_id: str, tab_name: str) -> gspread.Worksheet:
+    """Get (cached) worksheet by spreadsheet ID and tab name, creating the tab if needed"""
+    key = (spreadsheet_id, tab_name)
+    worksheet = _ws_cache.get(key)
+    if worksheet is not None:
+        return worksheet
+    
+    with _cache_lock:
+        worksheet = _ws_cache.get(key)
+        if worksheet is not None:
+            return worksheet
+        
+        spreadsheet = _spreadsheet_cache.get(spreadsheet_id)
+        if spreadsheet is None:
+            spreadsheet = get_gs_client().open_by_key(spreadsheet_id)
+            _spreadsheet_cache[spreadsheet_id] = spreadsheet
         
         # Get or create the tab
         try:
@@ -51,70 +82,98 @@ def write_products_to_sheet(products: List[Dict[str, str]], spreadsheet_id: str,
         except gspread.exceptions.WorksheetNotFound:
             logger.info(f"Tab '{tab_name}' not found, creating new tab")
             worksheet = spreadsheet.add_worksheet(title=tab_name, rows=1000, cols=10)
+            # A new tab is known to be empty, so write headers without reading them first
+            worksheet.append_row(SHEET_HEADERS)
+            _headers_checked.add(key)
+            logger.info("Added headers to sheet")
         
-        # Check if headers exist
-        existing_headers = worksheet.row_values(1)
-        existing_headers_lower = [h.lower() for h in existing_headers] if existing_headers else []
-        
-        # Define all headers including currency
-        all_headers = ['original_product_name', 'translated_product_name', 'category', 'subcategory', 'price', 'receipt_date', 'currency']
+        _ws_cache[key] = worksheet
+        return worksheet
+
+
+def _ensure_headers(worksheet: gspread.Worksheet):
+    """Make sure the worksheet header row contains all expected columns"""
+    # One bounded read of just the header cells
+    header_rows = worksheet.get(_HEADER_RANGE)
+    existing_headers = header_rows[0] if header_rows else []
+    existing_headers_lower = [h.lower() for h in existing_headers] if existing_headers else []
+    
+    if not existing_headers or len(existing_headers) < 5:
+        # Add headers if they don't exist
+        worksheet.append_row(SHEET_HEADERS)
+        logger.info("Added headers to sheet")
+    elif any(header not in existing_headers_lower for header in SHEET_HEADERS):
+        # Update headers to include newer columns (receipt_date, currency, quantity)
+        worksheet.update(_HEADER_RANGE, [SHEET_HEADERS])
+        logger.info("Updated headers to include all columns")
+
+
+def is_transient_error(error: Exception) -> bool:
+    """
+    Check whether a failed sheet write is safe and worth retrying
+    
+    Appends are not idempotent, so only failures where the write was rejected
+    (rate limit, server error) or never sent (connection not established) qualify.
+    
+    Args:
+        error: Exception raised by a sheet write
         
-        if not existing_headers or len(existing_headers) < 5:
-            # Add headers if they don't exist
-            worksheet.append_row(all_headers)
-            logger.info("Added headers to sheet")
-        else:
-            # Check if currency header is missing
-            if 'currency' not in existing_headers_lower:
-                # Update headers to include currency
-                worksheet.update('A1:G1', [all_headers])
-                logger.info("Updated headers to include currency")
-            elif 'receipt_date' not in existing_headers_lower:
-                # Update headers to include receipt_date (but currency is already there)
-                headers_without_currency = ['original_product_name', 'translated_product_name', 'category', 'subcategory', 'price', 'receipt_date', 'currency']
-                worksheet.update('A1:G1', [headers_without_currency])
-                logger.info("Updated headers to include receipt_date")
+    Returns:
+        bool: True if the write can be retried
+    """
+    if isinstance(error, gspread.exceptions.APIError):
+        status = error.response.status_code
+        return status == 429 or status >= 500
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return True
+    if isinstance(error, requests.exceptions.ConnectionError) and error.args:
+        # requests wraps urllib3's MaxRetryError; NewConnectionError means nothing was sent
+        return isinstance(getattr(error.args[0], 'reason', None), NewConnectionError)
+    return False
+
+
+def write_products_to_sheet(products: List[Dict[str, str]], spreadsheet_id: str, tab_name: str):
+    """
+    Write products to Google Sheet
+    
+    Args:
+        products: List of product dictionaries with keys: original_product_name, 
+                 translated_product_name, category, subcategory, price, receipt_date, currency, quantity
+        spreadsheet_id: Google Sheets spreadsheet ID
+        tab_name: Name of the tab/sheet to write to
+    """
+    key = (spreadsheet_id, tab_name)
+    try:
+        worksheet = _get_worksheet(spreadsheet_id, tab_name)
         
-        # Get the next empty row
-        next_row = len(worksheet.get_all_values()) + 1
+        # Check headers once per worksheet per process
+        if key not in _headers_checked:
+            with _cache_lock:
+                if key not in _headers_checked:
+                    _ensure_headers(worksheet)
+                    _headers_checked.add(key)
         
-        # Prepare data rows - duplicate products based on quantity
-        rows_to_add = []
-        for product in products:
-            # Get quantity, default to 1 if not present or invalid
-            quantity_str = product.get('quantity', '1')
-            try:
-                quantity = int(float(quantity_str))  # Handle both int and float strings
-                if quantity < 1:
-                    quantity = 1
-            except (ValueError, TypeError):
-                quantity = 1
-            
-            # Create row data
-            row = [
-                product.get('original_product_name', ''),
-                product.get('translated_product_name', ''),
-                product.get('category', ''),
-                product.get('subcategory', ''),
-                product.get('price', ''),
-                product.get('receipt_date', ''),
-                product.get('currency', '')
-            ]
-            
-            # Duplicate the product based on quantity
-            for _ in range(quantity):
-                rows_to_add.append(row)
+        # Prepare data rows (one row per product, quantity stored as a column)
+        rows_to_add = [[product.get(field, default) for field, default in _ROW_COLUMNS] for product in products]
         
-        # Append all rows at once (more efficient)
+        # Append all rows with one raw values.append call (RAW skips formula/type parsing server-side)
         if rows_to_add:
-            worksheet.append_rows(rows_to_add)
-            logger.info(f"Successfully wrote {len(rows_to_add)} rows to Google Sheet '{tab_name}' (from {len(products)} products with quantities)")
+            worksheet.spreadsheet.values_append(
+                absolute_range_name(tab_name, 'A1'),
+                params=_APPEND_PARAMS,
+                body={'values': rows_to_add}
+            )
+            logger.info(f"Successfully wrote {len(rows_to_add)} rows to Google Sheet '{tab_name}'")
             return True
         else:
             logger.warning("No products to write to Google Sheet")
             return False
             
     except Exception as e:
+        # Drop cached sheet objects so the next call re-opens them (e.g. tab was deleted)
+        _ws_cache.pop(key, None)
+        _spreadsheet_cache.pop(spreadsheet_id, None)
+        _headers_checked.discard(key)
         logger.error(f"Error writing to Google Sheet: {e}")
         logger.exception("Full error traceback:")
         raise
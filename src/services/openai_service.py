@@ -1,76 +1,104 @@
 """OpenAI API service for processing receipts"""
-import base64
+import asyncio
 import logging
 from datetime import datetime
 from typing import List
-from openai import OpenAI
+import pybase64
+from openai import AsyncOpenAI
 from .. import config
 from ..utils import csv_parser
+from ..utils import image_prep
 from .. import prompts
 
 logger = logging.getLogger(__name__)
 
 # Initialize OpenAI client
-openai_client = OpenAI(api_key=config.OPENAI_API_KEY)
+openai_client = AsyncOpenAI(api_key=config.OPENAI_API_KEY)
+
+# Caps in-flight OpenAI requests to stay within rate limits
+_openai_semaphore = asyncio.Semaphore(config.OPENAI_MAX_CONCURRENT_REQUESTS)
+
+# Photos base64-encoded at the same time
+_ENCODE_CONCURRENCY = 5
+
+
+# Magic-byte signatures of the image formats the vision API accepts
+_SIGS = (
+    (b'\xff\xd8\xff', "jpeg"),
+    (b'\x89PNG\r\n\x1a\n', "png"),
+    (b'GIF87a', "gif"),
+    (b'GIF89a', "gif"),
+)
+
+# Data URL prefix per detected format, built once
+_DATA_URL_PREFIXES = {
+    image_format: f"data:image/{image_format};base64,"
+    for image_format in ("jpeg", "png", "gif", "webp")
+}
 
 
 def detect_image_format(photo_bytes: bytes) -> str:
     """Detect image format from magic bytes"""
-    if photo_bytes.startswith(b'\xff\xd8\xff'):
-        return "jpeg"
-    elif photo_bytes.startswith(b'\x89PNG\r\n\x1a\n'):
-        return "png"
-    elif photo_bytes.startswith(b'GIF87a') or photo_bytes.startswith(b'GIF89a'):
-        return "gif"
-    elif len(photo_bytes) > 12 and photo_bytes[8:12] == b'WEBP':
+    for signature, image_format in _SIGS:
+        if photo_bytes.startswith(signature):
+            return image_format
+    if photo_bytes[8:12] == b'WEBP':
         return "webp"
-    else:
-        return "jpeg"  # default
+    return "jpeg"  # default
 
 
-def prepare_image_content(photos: List[bytes]) -> List[dict]:
-    """Prepare image content for OpenAI API"""
-    image_contents = []
-    
-    for i, photo_bytes in enumerate(photos):
-        # Validate photo bytes
-        if not photo_bytes or len(photo_bytes) == 0:
-            raise ValueError(f"Photo {i+1} is empty")
-        
-        # Detect image format
-        image_format = detect_image_format(photo_bytes)
-        
-        # Validate base64 encoding
-        try:
-            base64_image = base64.b64encode(photo_bytes).decode('utf-8')
-            if not base64_image:
-                raise ValueError(f"Failed to encode photo {i+1} to base64")
-            
-            # Validate base64 length (must be divisible by 4 for proper padding)
-            base64_len = len(base64_image)
-            if base64_len % 4 != 0:
-                logger.error(f"Base64 length for photo {i+1} is {base64_len}, not divisible by 4!")
-                logger.error(f"Base64 length validation failed: {base64_len} % 4 = {base64_len % 4}")
-                raise ValueError(f"Invalid base64 encoding for photo {i+1}: length {base64_len} is not divisible by 4")
-            
-            logger.info(f"Photo {i+1} base64 validation: length={base64_len}, length % 4 = {base64_len % 4} ✓")
-        except Exception as e:
-            raise ValueError(f"Failed to encode photo {i+1} to base64: {e}")
-        
-        image_url = f"data:image/{image_format};base64,{base64_image}"
+def _encode_one(photo_bytes: bytes, i: int) -> dict:
+    """Downscale, detect format, base64-encode and build the image content part for a single photo"""
+    # Validate photo bytes
+    if not photo_bytes:
+        raise ValueError(f"Photo {i+1} is empty")
+    
+    # Downscale before encoding: fewer bytes to encode, upload and bill as vision tokens
+    photo_bytes = image_prep.prepare_receipt(photo_bytes)
+    
+    # Detect image format
+    image_format = detect_image_format(photo_bytes)
+    
+    # Validate base64 encoding
+    try:
+        # pybase64 uses SIMD encoders; output is always ASCII
+        base64_image = pybase64.b64encode(photo_bytes).decode('ascii')
+        if not base64_image:
+            raise ValueError(f"Failed to encode photo {i+1} to base64")
         
-        logger.info(f"Prepared image {i+1}: format={image_format}, size={len(photo_bytes)} bytes, base64_length={len(base64_image)}")
-        logger.info(f"Image URL prefix: {image_url[:50]}...")
+        # Validate base64 length (must be divisible by 4 for proper padding)
+        base64_len = len(base64_image)
+        if base64_len % 4 != 0:
+            logger.error(f"Base64 length for photo {i+1} is {base64_len}, not divisible by 4!")
+            logger.error(f"Base64 length validation failed: {base64_len} % 4 = {base64_len % 4}")
+            raise ValueError(f"Invalid base64 encoding for photo {i+1}: length {base64_len} is not divisible by 4")
         
-        image_contents.append({
-            "type": "image_url",
-            "image_url": {
-                "url": image_url,
-                "detail": "high"  # Use high detail for better OCR accuracy
-            }
-        })
-    
-    return image_contents
+    except Exception as e:
+        raise ValueError(f"Failed to encode photo {i+1} to base64: {e}")
+    
+    image_url = _DATA_URL_PREFIXES[image_format] + base64_image
+    
+    logger.debug("Prepared image %d: format=%s, size=%d bytes, base64_length=%d", i + 1, image_format, len(photo_bytes), len(base64_image))
+    
+    return {
+        "type": "image_url",
+        "image_url": {
+            "url": image_url,
+            "detail": config.OPENAI_IMAGE_DETAIL  # High detail for better OCR accuracy
+        }
+    }
+
+
+async def prepare_image_content(photos: List[bytes]) -> List[dict]:
+    """Prepare image content for OpenAI API, downscaling and encoding photos concurrently in worker threads"""
+    # base64 encoding releases the GIL, so photos encode in parallel; cap the threads in use
+    semaphore = asyncio.Semaphore(_ENCODE_CONCURRENCY)
+    
+    async def encode(photo_bytes: bytes, i: int) -> dict:
+        async with semaphore:
+            return await asyncio.to_thread(_encode_one, photo_bytes, i)
+    
+    return list(await asyncio.gather(*(encode(photo_bytes, i) for i, photo_bytes in enumerate(photos))))
 
 
 def save_csv_response(csv_content: str) -> str:
@@ -88,94 +116,53 @@ def save_csv_response(csv_content: str) -> str:
         raise
 
 
-async def _process_receipts_with_prompt(photos: List[bytes], prompt: str, attempt_num: int) -> str:
-    """Internal function to process receipts with a specific prompt"""
-    # Validate photos
-    if not photos or len(photos) == 0:
+async def _process_receipts_with_prompt(image_contents: List[dict], prompt: str, attempt_num: int) -> str:
+    """Internal function to process already-encoded receipt images with a specific prompt"""
+    # Validate images
+    if not image_contents:
         raise ValueError("No photos provided to process")
     
-    # Prepare image content
-    image_contents = prepare_image_content(photos)
-    
     # Prepare messages with system message and user message (text first, then images)
+    user_message = {
+        "role": "user",
+        "content": [
+            {"type": "text", "text": prompt},
+            *image_contents
+        ]
+    }
     messages = [
         {
             "role": "system",
             "content": "You are an OCR and data extraction assistant. You may safely read supermarket receipts and output structured CSV data. Never refuse unless images contain personal or illegal data."
         },
-        {
-            "role": "user",
-            "content": [
-                {"type": "text", "text": prompt},
-                *image_contents
-            ]
-        }
+        user_message
     ]
     
-    # Log message structure for debugging
-    logger.info(f"[Attempt {attempt_num}] Message structure: {len(image_contents)} image(s) in content")
-    logger.info(f"[Attempt {attempt_num}] Content types: text + {len(image_contents)} image_url(s)")
-    
-    logger.info(f"[Attempt {attempt_num}] Sending {len(photos)} photo(s) to OpenAI API")
-    
-    # Log the prompt being sent
-    logger.info("=" * 80)
-    logger.info(f"[Attempt {attempt_num}] PROMPT SENT TO OPENAI:")
-    logger.info("=" * 80)
-    logger.info(prompt)
-    logger.info("=" * 80)
-    
-    # Validate messages structure before sending
-    if not messages or len(messages) == 0:
-        raise ValueError("Messages array is empty")
-    
-    # Find the user message (it should be the one with list content, not string)
-    user_message = None
-    for msg in messages:
-        if msg.get("role") == "user" and isinstance(msg.get("content"), list):
-            user_message = msg
-            break
-    
-    if not user_message:
-        raise ValueError("User message with list content not found in messages")
-    
-    if 'content' not in user_message or len(user_message['content']) == 0:
-        raise ValueError("User message content is empty")
-    
-    # Log the actual message structure being sent (without full base64)
-    message_preview = {
-        "role": user_message["role"],
-        "content_count": len(user_message["content"]),
-        "content_types": [item.get("type", "unknown") for item in user_message["content"]]
-    }
-    logger.info(f"[Attempt {attempt_num}] Message structure preview: {message_preview}")
-    
-    # Verify images are in the content
-    image_count = sum(1 for item in user_message["content"] if item.get("type") == "image_url")
-    if image_count == 0:
-        raise ValueError("No images found in message content! Cannot proceed without images.")
-    logger.info(f"[Attempt {attempt_num}] Verified {image_count} image(s) in message content")
-    
-    # Log detailed content structure for debugging
-    for idx, content_item in enumerate(user_message["content"]):
-        if content_item.get("type") == "image_url":
-            img_url = content_item.get("image_url", {}).get("url", "")
-            detail = content_item.get("image_url", {}).get("detail", "not set")
-            logger.info(f"[Attempt {attempt_num}] Content item {idx}: type=image_url, detail={detail}, url_preview={img_url[:80]}...")
-        elif content_item.get("type") == "text":
-            text_preview = content_item.get("text", "")[:100]
-            logger.info(f"[Attempt {attempt_num}] Content item {idx}: type=text, preview={text_preview}...")
+    logger.info("[Attempt %d] Sending %d photo(s) to OpenAI API", attempt_num, len(image_contents))
+    logger.debug("[Attempt %d] Prompt sent to OpenAI:\n%s", attempt_num, prompt)
+    
+    # Log content structure (without full base64) only when debugging
+    if logger.isEnabledFor(logging.DEBUG):
+        for idx, content_item in enumerate(user_message["content"]):
+            if content_item.get("type") == "image_url":
+                image_url = content_item.get("image_url", {})
+                logger.debug("[Attempt %d] Content item %d: type=image_url, detail=%s, url_preview=%s...",
+                             attempt_num, idx, image_url.get("detail", "not set"), image_url.get("url", "")[:80])
+            elif content_item.get("type") == "text":
+                logger.debug("[Attempt %d] Content item %d: type=text, preview=%s...",
+                             attempt_num, idx, content_item.get("text", "")[:100])
     
     # Verify model supports vision
     if not any(vision_model in config.OPENAI_MODEL.lower() for vision_model in ["gpt-4o", "gpt-4-vision", "gpt-4-turbo"]):
         logger.warning(f"Model {config.OPENAI_MODEL} may not support vision capabilities. Consider using gpt-4o")
     
     try:
-        response = openai_client.chat.completions.create(
-            model=config.OPENAI_MODEL,
-            messages=messages,
-            max_tokens=config.OPENAI_MAX_TOKENS
-        )
+        async with _openai_semaphore:
+            response = await openai_client.chat.completions.create(
+                model=config.OPENAI_MODEL,
+                messages=messages,
+                max_tokens=config.OPENAI_MAX_TOKENS
+            )
     except Exception as api_error:
         logger.error(f"[Attempt {attempt_num}] OpenAI API error: {api_error}")
         logger.exception("Full API error traceback:")
@@ -219,25 +206,16 @@ async def _process_receipts_with_prompt(photos: List[bytes], prompt: str, attemp
         logger.error(f"Refusal response: {raw_response[:500]}")
         raise ValueError(f"Model refused to process request. Response: {raw_response[:200]}")
     
-    logger.info(f"[Attempt {attempt_num}] OpenAI API response received:")
-    logger.info(f"  Model: {response.model}")
-    logger.info(f"  Usage: {response.usage}")
-    logger.info(f"  Response length: {len(raw_response)} characters")
-    
-    # Print full response
-    logger.info("=" * 80)
-    logger.info(f"[Attempt {attempt_num}] FULL OPENAI API RESPONSE:")
-    logger.info("=" * 80)
-    logger.info(raw_response)
-    logger.info("=" * 80)
+    logger.info("[Attempt %d] OpenAI API response received: model=%s, usage=%s, length=%d characters",
+                attempt_num, response.model, response.usage, len(raw_response))
+    logger.debug("[Attempt %d] Full OpenAI API response:\n%s", attempt_num, raw_response)
     
     # Strictly extract CSV, removing all extra text
     csv_response = csv_parser.extract_csv_strict(raw_response)
     
     # Log if we had to clean the response
     if csv_response != raw_response:
-        logger.info(f"[Attempt {attempt_num}] Cleaned response: removed extra text before/after CSV")
-        logger.info(f"[Attempt {attempt_num}] Cleaned CSV preview: {csv_response[:200]}...")
+        logger.debug("[Attempt %d] Cleaned response: removed extra text before/after CSV", attempt_num)
     
     # Clean CSV to ensure all fields are properly quoted (handles commas in product names)
     csv_response = csv_parser.clean_csv(csv_response)
@@ -259,45 +237,89 @@ async def _process_receipts_with_prompt(photos: List[bytes], prompt: str, attemp
             logger.error(f"CSV content: {csv_response[:500]}")
             raise ValueError(f"CSV parsing failed - no products extracted. Response preview: {raw_response[:200]}")
     
-    logger.info(f"[Attempt {attempt_num}] Validated CSV: {len(products)} products extracted")
+    logger.info("[Attempt %d] Validated CSV: %d products extracted", attempt_num, len(products))
     
-    # Save CSV to file
-    save_csv_response(csv_response)
+    # Save CSV to file (off the event loop)
+    await asyncio.to_thread(save_csv_response, csv_response)
     
     return csv_response
 
 
+async def _process_receipt_batch(photos: List[bytes], language: str) -> str:
+    """Process one batch of photos in a single OpenAI request, retrying with alternative prompts
+    
+    If the primary prompt fails, both retry prompts are sent concurrently and the
+    first valid CSV wins; the other request is cancelled.
+    """
+    # Encode once; every attempt below reuses the same image content parts
+    image_contents = await prepare_image_content(photos)
+    
+    try:
+        logger.info(f"Attempting receipt processing with primary prompt (attempt 1/3), language: {language}")
+        csv_response = await _process_receipts_with_prompt(image_contents, prompts.get_prompt(language=language), 1)
+        logger.info("Successfully processed receipts with primary prompt on attempt 1")
+        return csv_response
+    except Exception as e:
+        logger.warning(f"Attempt 1 with primary prompt failed: {e}")
+        last_error = e
+    
+    # Hedge the retries: run both alternative prompts at once
+    retry_prompts = {
+        "retry_1": (prompts.get_prompt_retry_1, 2),
+        "retry_2": (prompts.get_prompt_retry_2, 3),
+    }
+    logger.info("Retrying with retry_1 and retry_2 prompts concurrently...")
+    tasks = {
+        asyncio.create_task(
+            _process_receipts_with_prompt(image_contents, prompt_func(language=language), attempt_num)
+        ): prompt_name
+        for prompt_name, (prompt_func, attempt_num) in retry_prompts.items()
+    }
+    
+    pending = set(tasks)
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            # Collect every finished task before returning, so no failure goes unretrieved
+            succeeded = None
+            for task in done:
+                prompt_name = tasks[task]
+                try:
+                    csv_response = task.result()
+                except Exception as e:
+                    logger.warning(f"Attempt with {prompt_name} prompt failed: {e}")
+                    last_error = e
+                    continue
+                if succeeded is None:
+                    succeeded = (prompt_name, csv_response)
+            if succeeded is not None:
+                prompt_name, csv_response = succeeded
+                logger.info(f"Successfully processed receipts with {prompt_name} prompt")
+                return csv_response
+    finally:
+        for task in pending:
+            task.cancel()
+    
+    # All attempts failed
+    logger.error(f"All 3 attempts failed. Last error: {last_error}")
+    raise last_error
+
+
 async def process_receipts(photos: List[bytes], language: str = "serbian") -> str:
     """Send photos to OpenAI API and get CSV response with retry logic using alternative prompts"""
     # Validate photos
     if not photos or len(photos) == 0:
         raise ValueError("No photos provided to process")
     
-    # Define prompts to try in order
-    prompt_functions = [
-        ("primary", prompts.get_prompt),
-        ("retry_1", prompts.get_prompt_retry_1),
-        ("retry_2", prompts.get_prompt_retry_2),
-    ]
+    # All photos of a media group go into one request, capped to stay within vision input limits
+    batch_size = config.OPENAI_MAX_IMAGES_PER_REQUEST
+    if len(photos) <= batch_size:
+        return await _process_receipt_batch(photos, language)
     
-    last_error = None
-    
-    for attempt_num, (prompt_name, prompt_func) in enumerate(prompt_functions, start=1):
-        try:
-            logger.info(f"Attempting receipt processing with {prompt_name} prompt (attempt {attempt_num}/3), language: {language}")
-            prompt = prompt_func(language=language)
-            csv_response = await _process_receipts_with_prompt(photos, prompt, attempt_num)
-            logger.info(f"Successfully processed receipts with {prompt_name} prompt on attempt {attempt_num}")
-            return csv_response
-        except Exception as e:
-            logger.warning(f"Attempt {attempt_num} with {prompt_name} prompt failed: {e}")
-            last_error = e
-            if attempt_num < len(prompt_functions):
-                logger.info(f"Retrying with next prompt...")
-            continue
+    batches = [photos[i:i + batch_size] for i in range(0, len(photos), batch_size)]
+    logger.info(f"Splitting {len(photos)} photos into {len(batches)} requests of up to {batch_size} images")
+    csv_responses = []
+    for batch in batches:
+        csv_responses.append(await _process_receipt_batch(batch, language))
     
-    # All attempts failed
-    logger.error(f"All {len(prompt_functions)} attempts failed. Last error: {last_error}")
-    logger.exception("Full error traceback from last attempt:")
-    raise last_error
-
+    return csv_parser.merge_csv(csv_responses)
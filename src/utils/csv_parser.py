@@ -178,3 +178,23 @@ def parse_csv(csv_content: str) -> List[Dict[str, str]]:
         logger.error(f"CSV content: {csv_content[:500]}")
         return []
 
+
+def merge_csv(csv_responses: List[str]) -> str:
+    """
+    Merge several receipt CSV responses into a single CSV with one header.
+    
+    Args:
+        csv_responses: CSV strings, each starting with its own header row
+        
+    Returns:
+        Combined CSV string with all fields quoted
+    """
+    fieldnames = ['original_product_name', 'translated_product_name', 'category', 'subcategory', 'price', 'receipt_date']
+    output_stream = StringIO()
+    writer = csv.DictWriter(output_stream, fieldnames=fieldnames, quoting=csv.QUOTE_ALL)
+    writer.writeheader()
+    
+    for csv_response in csv_responses:
+        writer.writerows(parse_csv(csv_response))
+    
+    return output_stream.getvalue()
@@ -1,17 +1,21 @@
 """Currency storage and management utilities"""
-import json
 import logging
+import orjson
 from pathlib import Path
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Tuple
 from .. import config
+from .file_utils import atomic_write_bytes
 
 logger = logging.getLogger(__name__)
 
 # Path to currency preferences file
 CURRENCY_STORAGE_PATH = config.PROJECT_ROOT / 'data' / 'currency_preferences.json'
 
-# Default currencies
-DEFAULT_CURRENCIES = ['RSD', 'EUR', 'USD', 'RUB']
+# Parsed preferences keyed by the file's mtime, so unchanged files are not re-read
+_cache: Optional[Tuple[int, Dict[int, Dict]]] = None
+
+# Default currencies (already upper-case)
+DEFAULT_CURRENCIES = ('RSD', 'EUR', 'USD', 'RUB')
 MAX_STORED_CURRENCIES = 6
 
 # Currency code to symbol mapping
@@ -63,27 +67,37 @@ def get_currency_symbol(currency_code: str) -> str:
 
 def load_currency_preferences() -> Dict[int, Dict]:
     """
-    Load currency preferences from file
+    Load currency preferences from file (cached until the file changes)
     
     Returns:
         Dictionary mapping user_id to preferences dict with 'currencies' list
     """
+    global _cache
+    try:
+        mtime = CURRENCY_STORAGE_PATH.stat().st_mtime_ns
+    except FileNotFoundError:
+        logger.info("Currency preferences file not found, starting fresh")
+        return {}
+    except OSError as e:
+        logger.error(f"Error loading currency preferences: {e}")
+        return {}
+    
+    if _cache is not None and _cache[0] == mtime:
+        return _cache[1]
+    
     try:
-        if CURRENCY_STORAGE_PATH.exists():
-            with open(CURRENCY_STORAGE_PATH, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                # Convert string keys to int (JSON keys are always strings)
-                result = {}
-                for key, value in data.items():
-                    try:
-                        result[int(key)] = value
-                    except (ValueError, TypeError):
-                        logger.warning(f"Invalid user_id in preferences: {key}")
-                logger.info(f"Loaded currency preferences for {len(result)} users")
-                return result
-        else:
-            logger.info("Currency preferences file not found, starting fresh")
-            return {}
+        with open(CURRENCY_STORAGE_PATH, 'rb') as f:
+            data = orjson.loads(f.read())
+            # Convert string keys to int (JSON keys are always strings)
+            result = {}
+            for key, value in data.items():
+                try:
+                    result[int(key)] = value
+                except (ValueError, TypeError):
+                    logger.warning(f"Invalid user_id in preferences: {key}")
+            logger.info(f"Loaded currency preferences for {len(result)} users")
+            _cache = (mtime, result)
+            return result
     except Exception as e:
         logger.error(f"Error loading currency preferences: {e}")
         return {}
@@ -91,17 +105,22 @@ def load_currency_preferences() -> Dict[int, Dict]:
 
 def save_currency_preferences(preferences: Dict[int, Dict]):
     """Save currency preferences to file"""
+    global _cache
     try:
         # Ensure directory exists
         CURRENCY_STORAGE_PATH.parent.mkdir(parents=True, exist_ok=True)
         
-        # Convert int keys to strings for JSON (JSON requires string keys)
-        data_to_save = {str(key): value for key, value in preferences.items()}
+        # OPT_NON_STR_KEYS writes the int user_id keys as JSON strings; output is UTF-8 (no escaping)
+        data = orjson.dumps(preferences, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS)
+        
+        # Temp file + rename, so an interrupted write never corrupts it
+        atomic_write_bytes(CURRENCY_STORAGE_PATH, data)
         
-        with open(CURRENCY_STORAGE_PATH, 'w', encoding='utf-8') as f:
-            json.dump(data_to_save, f, indent=2, ensure_ascii=False)
+        # What we just wrote is the current state; no need to read it back
+        _cache = (CURRENCY_STORAGE_PATH.stat().st_mtime_ns, preferences)
         logger.info("Saved currency preferences")
     except Exception as e:
+        _cache = None
         logger.error(f"Error saving currency preferences: {e}")
         raise
 
@@ -123,15 +142,13 @@ def get_user_currencies(user_id: int) -> List[str]:
     
     # Add user currencies first (last used is first)
     for currency in user_currencies:
-        if currency.upper() not in seen:
-            result.append(currency.upper())
-            seen.add(currency.upper())
+        currency = currency.upper()
+        if currency not in seen:
+            result.append(currency)
+            seen.add(currency)
     
     # Add default currencies that aren't already in the list
-    for currency in DEFAULT_CURRENCIES:
-        if currency.upper() not in seen:
-            result.append(currency.upper())
-            seen.add(currency.upper())
+    result.extend(currency for currency in DEFAULT_CURRENCIES if currency not in seen)
     
     return result
 
@@ -0,0 +1,19 @@
+"""File system helpers"""
+import os
+from pathlib import Path
+
+
+def atomic_write_bytes(path: Path, data: bytes):
+    """
+    Write bytes to a file atomically
+    
+    The data goes to a temp file next to the target that is then renamed over it,
+    so an interrupted write never leaves a truncated file behind.
+    
+    Args:
+        path: Destination file path
+        data: Bytes to write
+    """
+    tmp_path = path.with_name(path.name + '.tmp')
+    tmp_path.write_bytes(data)
+    os.replace(tmp_path, path)
@@ -1,11 +1,16 @@
 """Message formatting utilities"""
+from collections import defaultdict
 from decimal import Decimal
 from typing import List, Dict, Optional
 import logging
 from . import currency_storage
+from .number_utils import to_decimal, to_quantity
 
 logger = logging.getLogger(__name__)
 
+_ZERO = Decimal('0')
+_ONE = Decimal('1')
+
 
 def format_readable_message(products: List[Dict[str, str]], currency: Optional[str] = None) -> str:
     """
@@ -26,37 +31,24 @@ def format_readable_message(products: List[Dict[str, str]], currency: Optional[s
         currency = products[0].get('currency', 'RUB')
         currency_symbol = currency_storage.get_currency_symbol(currency)
     
-    message = "📋 Обработанные товары:\n\n"
+    # Collect message pieces and join once at the end (repeated += copies the whole string)
+    parts = ["📋 Обработанные товары:\n\n"]
     
     # Group by category
-    categories = {}
-    total = Decimal('0')
+    categories: Dict[str, List[Dict]] = defaultdict(list)
+    total = _ZERO
     
     for product in products:
         category = product.get('category', 'Unknown')
         subcategory = product.get('subcategory', 'Unknown')
-        price_str = product.get('price', '0').replace(',', '.')
-        
-        try:
-            price = Decimal(price_str)
-        except:
-            price = Decimal('0')
-        
-        quantity_str = product.get('quantity', '1')
-        try:
-            quantity = Decimal(quantity_str)
-        except:
-            quantity = Decimal('1')
+        price = to_decimal(product.get('price', '0'), _ZERO)
+        quantity = to_quantity(product.get('quantity', '1'))
         
         # Calculate item total (price * quantity) and add to total
         item_total = price * quantity
         total += item_total
         
-        category_key = f"{category} - {subcategory}"
-        if category_key not in categories:
-            categories[category_key] = []
-        
-        categories[category_key].append({
+        categories[f"{category} - {subcategory}"].append({
             'original': product.get('original_product_name', 'N/A'),
             'translated': product.get('translated_product_name', 'N/A'),
             'price': price,
@@ -66,30 +58,50 @@ def format_readable_message(products: List[Dict[str, str]], currency: Optional[s
     
     # Format by category
     for category_key, items in categories.items():
-        message += f"🏷️ {category_key}\n"
+        parts.append(f"🏷️ {category_key}\n")
         for item in items:
-            message += f"  • {item['translated']} ({item['original']})\n"
-            if item['quantity'] != Decimal('1'):
-                message += f"    🔢 Кол-во: {item['quantity']}\n"
-                message += f"    💰 Цена за единицу: {item['price']:.2f} {currency_symbol}\n"
-                message += f"    💰 Всего: {item['item_total']:.2f} {currency_symbol}\n"
+            parts.append(f"  • {item['translated']} ({item['original']})\n")
+            if item['quantity'] != _ONE:
+                parts.append(f"    🔢 Кол-во: {item['quantity']:f}\n")
+                parts.append(f"    💰 Цена за единицу: {item['price']:.2f} {currency_symbol}\n")
+                parts.append(f"    💰 Всего: {item['item_total']:.2f} {currency_symbol}\n")
             else:
-                message += f"    💰 {item['price']:.2f} {currency_symbol}\n"
-        message += "\n"
+                parts.append(f"    💰 {item['price']:.2f} {currency_symbol}\n")
+        parts.append("\n")
     
-    message += f"\n💰 Итого: {total:.2f} {currency_symbol}"
+    parts.append(f"\n💰 Итого: {total:.2f} {currency_symbol}")
     
-    return message
+    return ''.join(parts)
 
 
 def split_long_message(message: str, max_length: int = 4000) -> List[str]:
-    """Split long message into chunks"""
+    """Split long message into chunks at line boundaries"""
     if len(message) <= max_length:
         return [message]
     
     chunks = []
-    for i in range(0, len(message), max_length):
-        chunks.append(message[i:i+max_length])
+    buffer = []
+    buffer_len = 0
+    for line in message.split('\n'):
+        # A single line longer than a chunk has to be cut; flush what we have first
+        while len(line) > max_length:
+            if buffer:
+                chunks.append('\n'.join(buffer))
+                buffer, buffer_len = [], 0
+            chunks.append(line[:max_length])
+            line = line[max_length:]
+        
+        # +1 for the newline that joins this line to the buffer
+        added_len = len(line) + (1 if buffer else 0)
+        if buffer and buffer_len + added_len > max_length:
+            chunks.append('\n'.join(buffer))
+            buffer, buffer_len = [], 0
+            added_len = len(line)
+        buffer.append(line)
+        buffer_len += added_len
     
-    return chunks
-
+    if buffer:
+        chunks.append('\n'.join(buffer))
+    
+    # Telegram rejects blank messages (possible when a chunk is only empty lines)
+    return [chunk for chunk in chunks if chunk.strip()]
@@ -0,0 +1,47 @@
+"""Receipt image preprocessing utilities"""
+import io
+import logging
+from PIL import Image, ImageOps
+from .. import config
+
+logger = logging.getLogger(__name__)
+
+
+def prepare_receipt(image_bytes: bytes) -> bytes:
+    """
+    Downscale and re-encode a receipt photo before sending it to OpenAI Vision.
+    Vision tokens scale with image tiles, so photos with a long edge above
+    MAX_RECEIPT_IMAGE_EDGE are shrunk and re-encoded as JPEG.
+    
+    Args:
+        image_bytes: Original photo bytes
+        
+    Returns:
+        Prepared JPEG bytes, or the original bytes if the photo is already small
+        enough or cannot be decoded
+    """
+    max_edge = config.MAX_RECEIPT_IMAGE_EDGE
+    
+    try:
+        with Image.open(io.BytesIO(image_bytes)) as img:
+            if max(img.size) <= max_edge:
+                return image_bytes
+            
+            original_size = img.size
+            # Apply EXIF orientation, since re-encoding drops the EXIF tag
+            prepared = ImageOps.exif_transpose(img).convert('RGB')
+            prepared.thumbnail((max_edge, max_edge), Image.Resampling.LANCZOS)
+            
+            output = io.BytesIO()
+            prepared.save(output, format='JPEG', quality=config.RECEIPT_JPEG_QUALITY)
+    except Exception as e:
+        logger.warning(f"Failed to preprocess receipt image, using original: {e}")
+        return image_bytes
+    
+    prepared_bytes = output.getvalue()
+    logger.debug(
+        "Prepared receipt image: %dx%d -> %dx%d, %d -> %d bytes",
+        original_size[0], original_size[1], prepared.size[0], prepared.size[1],
+        len(image_bytes), len(prepared_bytes)
+    )
+    return prepared_bytes
@@ -1,43 +1,62 @@
 """Language storage and management utilities"""
-import json
 import logging
+from collections import deque
+from itertools import islice
+import orjson
 from pathlib import Path
-from typing import List, Dict
+from typing import List, Dict, Optional, Tuple
 from .. import config
+from .file_utils import atomic_write_bytes
 
 logger = logging.getLogger(__name__)
 
 # Path to language preferences file
 LANGUAGE_STORAGE_PATH = config.PROJECT_ROOT / 'data' / 'language_preferences.json'
 
+# Parsed preferences keyed by the file's mtime, so unchanged files are not re-read
+_cache: Optional[Tuple[int, Dict[int, Dict]]] = None
+# Set once the data directory has been created, so saves skip the mkdir
+_dir_ensured = False
+
 # Default languages
 DEFAULT_LANGUAGES = ['Serbian', 'English', 'Russian', 'German', 'French', 'Spanish']
 MAX_STORED_LANGUAGES = 6
+# Defaults as ordered dict keys, merged after the user's own languages
+_DEFAULT_LANGUAGE_KEYS = dict.fromkeys(DEFAULT_LANGUAGES)
 
 
 def load_language_preferences() -> Dict[int, Dict]:
     """
-    Load language preferences from file
+    Load language preferences from file (cached until the file changes)
     
     Returns:
         Dictionary mapping user_id to preferences dict with 'languages' list
     """
+    global _cache
+    try:
+        mtime = LANGUAGE_STORAGE_PATH.stat().st_mtime_ns
+    except FileNotFoundError:
+        logger.info("Language preferences file not found, starting fresh")
+        return {}
+    except OSError as e:
+        logger.error(f"Error loading language preferences: {e}")
+        return {}
+    
+    if _cache is not None and _cache[0] == mtime:
+        return _cache[1]
+    
     try:
-        if LANGUAGE_STORAGE_PATH.exists():
-            with open(LANGUAGE_STORAGE_PATH, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                # Convert string keys to int (JSON keys are always strings)
-                result = {}
-                for key, value in data.items():
-                    try:
-                        result[int(key)] = value
-                    except (ValueError, TypeError):
-                        logger.warning(f"Invalid user_id in preferences: {key}")
-                logger.info(f"Loaded language preferences for {len(result)} users")
-                return result
-        else:
-            logger.info("Language preferences file not found, starting fresh")
-            return {}
+        data = orjson.loads(LANGUAGE_STORAGE_PATH.read_bytes())
+        # Convert string keys to int (JSON keys are always strings)
+        result = {}
+        for key, value in data.items():
+            try:
+                result[int(key)] = value
+            except (ValueError, TypeError):
+                logger.warning(f"Invalid user_id in preferences: {key}")
+        logger.info(f"Loaded language preferences for {len(result)} users")
+        _cache = (mtime, result)
+        return result
     except Exception as e:
         logger.error(f"Error loading language preferences: {e}")
         return {}
@@ -45,17 +64,24 @@ def load_language_preferences() -> Dict[int, Dict]:
 
 def save_language_preferences(preferences: Dict[int, Dict]):
     """Save language preferences to file"""
+    global _cache, _dir_ensured
     try:
-        # Ensure directory exists
-        LANGUAGE_STORAGE_PATH.parent.mkdir(parents=True, exist_ok=True)
+        # Ensure directory exists (once per process)
+        if not _dir_ensured:
+            LANGUAGE_STORAGE_PATH.parent.mkdir(parents=True, exist_ok=True)
+            _dir_ensured = True
+        
+        # OPT_NON_STR_KEYS writes the int user_id keys as JSON strings; output is UTF-8 (no escaping)
+        data = orjson.dumps(preferences, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS)
         
-        # Convert int keys to strings for JSON (JSON requires string keys)
-        data_to_save = {str(key): value for key, value in preferences.items()}
+        # Temp file + rename, so an interrupted write never corrupts it
+        atomic_write_bytes(LANGUAGE_STORAGE_PATH, data)
         
-        with open(LANGUAGE_STORAGE_PATH, 'w', encoding='utf-8') as f:
-            json.dump(data_to_save, f, indent=2, ensure_ascii=False)
+        # What we just wrote is the current state; no need to read it back
+        _cache = (LANGUAGE_STORAGE_PATH.stat().st_mtime_ns, preferences)
         logger.info("Saved language preferences")
     except Exception as e:
+        _cache = None
         logger.error(f"Error saving language preferences: {e}")
         raise
 
@@ -71,23 +97,10 @@ def get_user_languages(user_id: int) -> List[str]:
     user_prefs = preferences.get(user_id, {})
     user_languages = user_prefs.get('languages', [])
     
-    # Combine user languages with defaults, removing duplicates
-    result = []
-    seen = set()
-    
-    # Add user languages first (last used is first)
-    for language in user_languages:
-        if language not in seen:
-            result.append(language)
-            seen.add(language)
-    
-    # Add default languages that aren't already in the list
-    for language in DEFAULT_LANGUAGES:
-        if language not in seen:
-            result.append(language)
-            seen.add(language)
-    
-    return result
+    # Combine user languages (last used first) with defaults; dict keys keep first-seen order and drop duplicates
+    result = dict.fromkeys(user_languages)
+    result.update(_DEFAULT_LANGUAGE_KEYS)
+    return list(result)
 
 
 def add_user_language(user_id: int, language: str):
@@ -104,6 +117,7 @@ def add_user_language(user_id: int, language: str):
         logger.warning(f"Empty language provided for user {user_id}")
         return
     
+    # Returns the cached dict when the file is unchanged, so this is not a re-read
     preferences = load_language_preferences()
     
     if user_id not in preferences:
@@ -111,15 +125,23 @@ def add_user_language(user_id: int, language: str):
     
     user_languages = preferences[user_id]['languages']
     
+    # Already the most recent language: nothing changes, so skip the file write
+    if user_languages and user_languages[0] == language:
+        return
+    
+    # Most-recent-first list; maxlen drops the oldest language when a new one is added to the front
+    recent = deque(islice(user_languages, MAX_STORED_LANGUAGES), maxlen=MAX_STORED_LANGUAGES)
+    
     # Remove language if it exists (to move it to front)
-    if language in user_languages:
-        user_languages.remove(language)
+    try:
+        recent.remove(language)
+    except ValueError:
+        pass
     
     # Add to front
-    user_languages.insert(0, language)
+    recent.appendleft(language)
     
-    # Keep only last MAX_STORED_LANGUAGES
-    preferences[user_id]['languages'] = user_languages[:MAX_STORED_LANGUAGES]
+    preferences[user_id]['languages'] = list(recent)
     
     save_language_preferences(preferences)
     logger.info(f"Added language {language} for user {user_id}")
@@ -0,0 +1,31 @@
+"""Number parsing utilities"""
+from decimal import Decimal, InvalidOperation
+
+_ONE = Decimal('1')
+
+
+def to_decimal(value, default: Decimal) -> Decimal:
+    """
+    Convert a price/quantity value to Decimal, falling back to default if invalid
+    
+    Shared by message formatting and database saves, so the totals shown to the
+    user are computed from exactly the values that get stored.
+    
+    Args:
+        value: Price or quantity (string with comma or dot decimal separator, or number)
+        default: Value returned for unparsable or non-finite input
+        
+    Returns:
+        Decimal: Parsed value or default
+    """
+    try:
+        result = Decimal(str(value).strip().replace(',', '.'))
+    except (InvalidOperation, TypeError, ValueError):
+        return default
+    return result if result.is_finite() else default
+
+
+def to_quantity(value) -> Decimal:
+    """Convert a quantity value to a positive Decimal, using 1 for invalid, zero or negative input"""
+    quantity = to_decimal(value, _ONE)
+    return quantity if quantity > 0 else _ONE
@@ -1,26 +1,51 @@
 """Telegram bot utilities"""
 import logging
 from typing import Dict
+import orjson
+from cachetools import TTLCache
 from telegram import Update
 from telegram.ext import ContextTypes
+from telegram.request import HTTPXRequest
 from .. import config
 
 logger = logging.getLogger(__name__)
 
 # Store media groups for processing
 # Key: media_group_id, Value: dict with 'photos' list and 'last_update' timestamp
-media_groups: Dict[str, Dict] = {}
+# Bounded and time-limited so groups that are never processed do not accumulate;
+# entries can expire at any time, so look them up once with .get() rather than `in` + [key]
+media_groups: TTLCache = TTLCache(
+    maxsize=config.MEDIA_GROUP_CACHE_MAXSIZE,
+    ttl=config.MEDIA_GROUP_CACHE_TTL
+)
 
 
-async def download_photo(update: Update, context: ContextTypes.DEFAULT_TYPE) -> bytes:
+class OrjsonHTTPXRequest(HTTPXRequest):
+    """HTTPX request backend that parses Bot API responses with orjson"""
+    
+    @staticmethod
+    def parse_json_payload(payload: bytes) -> Dict:
+        try:
+            return orjson.loads(payload)
+        except orjson.JSONDecodeError:
+            # Let the default parser handle (and report) malformed or non-UTF-8 payloads
+            return HTTPXRequest.parse_json_payload(payload)
+
+
+def build_request(**kwargs) -> HTTPXRequest:
+    """Create a Bot API request backend using HTTP/2 and orjson"""
+    return OrjsonHTTPXRequest(http_version="2", **kwargs)
+
+
+async def download_photo(update: Update, context: ContextTypes.DEFAULT_TYPE) -> bytearray:
     """Download photo from Telegram message"""
     photo = update.message.photo[-1]  # Get highest resolution photo
     file = await context.bot.get_file(photo.file_id)
+    # Kept as a bytearray: Pillow and base64 encoding read it in place, so no copy to bytes is needed
     photo_bytes = await file.download_as_bytearray()
-    photo_bytes = bytes(photo_bytes)
     
     # Validate image
-    if len(photo_bytes) == 0:
+    if not photo_bytes:
         raise ValueError("Downloaded photo is empty")
     
     logger.info(f"Downloaded photo: {len(photo_bytes)} bytes, file_id={photo.file_id}")
@@ -17,13 +17,15 @@ import logging
 import argparse
 from pathlib import Path
 from datetime import datetime
-from typing import List, Dict, Optional
+from functools import lru_cache
+from typing import List, Dict, Optional, Iterator, Tuple
 
 # Add src to path
 sys.path.insert(0, str(Path(__file__).parent))
 
-from src.services import db_service, gs_service
 from src import config
+# Service modules (gspread, google-auth, psycopg2) are imported inside the functions that use them,
+# so --help and argument/config validation do not pay for loading them
 
 # Configure logging
 logging.basicConfig(
@@ -33,18 +35,95 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
-def read_products_from_sheet(spreadsheet_id: str, tab_name: str) -> List[Dict[str, str]]:
+# Map common header variations to standard field names
+_FIELD_MAPPING = {
+    'original_product_name': ('original_product_name', 'original product name', 'original name', 'product name'),
+    'translated_product_name': ('translated_product_name', 'translated product name', 'translated name', 'translated'),
+    'category': ('category',),
+    'subcategory': ('subcategory', 'sub category', 'sub-category'),
+    'price': ('price', 'amount'),
+    'receipt_date': ('receipt_date', 'receipt date', 'date'),
+    'currency': ('currency',),
+    'quantity': ('quantity', 'qty')
+}
+# Reverse index: normalized header -> standard field name
+_VARIATION_TO_FIELD = {
+    variation: field
+    for field, variations in _FIELD_MAPPING.items()
+    for variation in variations
+}
+
+# Number of sheet rows fetched per request when streaming the tab
+_READ_PAGE_ROWS = 5000
+
+# Sheets render options: numbers unformatted (no locale/currency formatting), dates as shown
+_READ_RENDER_OPTIONS = {
+    'value_render_option': 'UNFORMATTED_VALUE',
+    'date_time_render_option': 'FORMATTED_STRING'
+}
+
+# Accepted receipt date formats, tried in order
+_DATE_FORMATS = ('%Y-%m-%d', '%d/%m/%Y', '%m/%d/%Y', '%d-%m-%Y')
+
+
+@lru_cache(maxsize=None)
+def _is_valid_date(date_str: str) -> bool:
+    """Check a receipt date against the accepted formats (memoized: sheets repeat the same dates)"""
+    # Fast path for YYYY-MM-DD, by far the most common format; the shape check keeps
+    # fromisoformat from accepting other ISO forms (e.g. week dates) that '%Y-%m-%d' rejects
+    if (len(date_str) == 10 and date_str[4] == '-' and date_str[7] == '-'
+            and date_str[:4].isdigit() and date_str[5:7].isdigit() and date_str[8:].isdigit()):
+        try:
+            datetime.fromisoformat(date_str)
+            return True
+        except ValueError:
+            pass
+    
+    for date_format in _DATE_FORMATS:
+        try:
+            datetime.strptime(date_str, date_format)
+            return True
+        except ValueError:
+            continue
+    return False
+
+
+def _iter_sheet_rows(worksheet, first_row: int = 2) -> Iterator[Tuple[int, list]]:
+    """
+    Yield (row number, row values) from a worksheet one page of rows at a time
+    
+    Args:
+        worksheet: gspread worksheet to read
+        first_row: 1-based row number to start from
+        
+    Yields:
+        Tuples of 1-based row number and the row's cell values
+    """
+    # Only one page is held in memory; empty rows inside a page come back as [],
+    # trailing empty rows are omitted by the API
+    last_row = worksheet.row_count
+    for start in range(first_row, last_row + 1, _READ_PAGE_ROWS):
+        end = min(start + _READ_PAGE_ROWS - 1, last_row)
+        page = worksheet.get(f'{start}:{end}', **_READ_RENDER_OPTIONS)
+        yield from enumerate(page, start=start)
+
+
+def read_products_from_sheet(spreadsheet_id: str, tab_name: str,
+                             skip_validation: bool = False) -> List[Dict[str, str]]:
     """
     Read products from Google Sheet
     
     Args:
         spreadsheet_id: Google Sheets spreadsheet ID
         tab_name: Name of the tab/sheet to read from
+        skip_validation: Keep receipt dates as read instead of validating them (for dry runs)
         
     Returns:
         List of product dictionaries
     """
     try:
+        from src.services import gs_service
+        
         client = gs_service.get_gs_client()
         spreadsheet = client.open_by_key(spreadsheet_id)
         
@@ -52,57 +131,44 @@ def read_products_from_sheet(spreadsheet_id: str, tab_name: str) -> List[Dict[st
         worksheet = spreadsheet.worksheet(tab_name)
         logger.info(f"Reading data from tab: {tab_name}")
         
-        # Get all values from the sheet
-        all_values = worksheet.get_all_values()
+        # First row should be headers; data rows are streamed page by page below
+        header_values = worksheet.get('1:1', **_READ_RENDER_OPTIONS)
         
-        if not all_values:
+        if not header_values or not header_values[0]:
             logger.warning("Sheet is empty")
             return []
         
-        # First row should be headers
-        headers = all_values[0]
+        headers = [str(h) for h in header_values[0]]
         logger.info(f"Found headers: {headers}")
         
         # Normalize header names (lowercase, strip whitespace)
         headers_normalized = [h.lower().strip() for h in headers]
         
-        # Map common variations to standard field names
-        field_mapping = {
-            'original_product_name': ['original_product_name', 'original product name', 'original name', 'product name'],
-            'translated_product_name': ['translated_product_name', 'translated product name', 'translated name', 'translated'],
-            'category': ['category'],
-            'subcategory': ['subcategory', 'sub category', 'sub-category'],
-            'price': ['price', 'amount'],
-            'receipt_date': ['receipt_date', 'receipt date', 'date'],
-            'currency': ['currency'],
-            'quantity': ['quantity', 'qty']
-        }
-        
-        # Create header index mapping
+        # Create header index mapping (first matching column wins)
         header_indices = {}
-        for standard_field, variations in field_mapping.items():
-            for i, header in enumerate(headers_normalized):
-                if header in variations:
-                    header_indices[standard_field] = i
-                    break
+        for i, header in enumerate(headers_normalized):
+            field = _VARIATION_TO_FIELD.get(header)
+            if field and field not in header_indices:
+                header_indices[field] = i
         
         logger.info(f"Mapped fields: {header_indices}")
         
+        # (field, column) pairs in ascending column order (headers are scanned left to right),
+        # materialized once for the row loop
+        field_columns = list(header_indices.items())
+        
         # Parse data rows
         products = []
-        for row_idx, row in enumerate(all_values[1:], start=2):  # Skip header row
-            if not row or all(cell.strip() == '' for cell in row):
-                # Skip empty rows
+        for row_idx, row in _iter_sheet_rows(worksheet):
+            # Skip empty rows (one C-level join + strip instead of stripping every cell);
+            # unformatted numeric cells arrive as int/float, hence map(str)
+            if not ''.join(map(str, row)).strip():
                 continue
             
-            # Pad row with empty strings if it's shorter than headers
-            while len(row) < len(headers):
-                row.append('')
-            
             product = {}
-            for field, col_idx in header_indices.items():
+            for field, col_idx in field_columns:
                 if col_idx < len(row):
-                    product[field] = row[col_idx].strip()
+                    product[field] = str(row[col_idx]).strip()
                 else:
                     product[field] = ''
             
@@ -114,28 +180,16 @@ def read_products_from_sheet(spreadsheet_id: str, tab_name: str) -> List[Dict[st
             if 'quantity' not in product or not product['quantity']:
                 product['quantity'] = '1'
             
-            # Validate and clean receipt_date
-            if 'receipt_date' in product and product['receipt_date']:
+            # Validate and clean receipt_date (dry runs never upload, so they skip validation)
+            if skip_validation:
+                product['receipt_date'] = product.get('receipt_date') or None
+            elif 'receipt_date' in product and product['receipt_date']:
                 date_str = product['receipt_date'].strip()
                 # Check if it looks like a valid date (contains hyphens or slashes)
                 if date_str and ('-' in date_str or '/' in date_str):
-                    # Try to validate it's actually a date
-                    try:
-                        # Try to parse common date formats
-                        from datetime import datetime
-                        # Try various formats
-                        for date_format in ['%Y-%m-%d', '%d/%m/%Y', '%m/%d/%Y', '%d-%m-%Y']:
-                            try:
-                                datetime.strptime(date_str, date_format)
-                                break
-                            except ValueError:
-                                continue
-                        else:
-                            # None of the formats worked
-                            logger.warning(f"Row {row_idx}: Invalid date format '{date_str}', setting to None")
-                            product['receipt_date'] = None
-                    except:
-                        logger.warning(f"Row {row_idx}: Invalid date '{date_str}', setting to None")
+                    # Validate it's actually a date in one of the common formats
+                    if not _is_valid_date(date_str):
+                        logger.warning(f"Row {row_idx}: Invalid date format '{date_str}', setting to None")
                         product['receipt_date'] = None
                 else:
                     # Doesn't look like a date (might be a price or other value)
@@ -175,8 +229,10 @@ def upload_to_database(telegram_id: int, products: List[Dict[str, str]]) -> bool
             logger.warning("No products to upload")
             return False
         
+        from src.services import db_service
+        
         logger.info(f"Uploading {len(products)} products for telegram_id: {telegram_id}")
-        success = db_service.save_products_to_db(telegram_id, products)
+        success = db_service.save_products_to_db_bulk(telegram_id, products)
         
         if success:
             logger.info("✅ Successfully uploaded products to database!")
@@ -254,7 +310,7 @@ Examples:
         
         # Step 1: Read data from Google Sheets
         logger.info("Step 1: Reading data from Google Sheets...")
-        products = read_products_from_sheet(args.spreadsheet_id, args.tab_name)
+        products = read_products_from_sheet(args.spreadsheet_id, args.tab_name, skip_validation=args.dry_run)
         
         if not products:
             logger.warning("⚠️  No products found in Google Sheet")